@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+'''
+Calculate work functions of slabs from LOCPOT and OUTCAR in job directories.
+
+Usage:
+    work_function.py [--axis z] dir1 dir2 ...
+'''
+
+import argparse
+import logging
+import os
+
+from vaspy.electro import LocPot
+from vaspy.iter import OutCar
+
+_logger = logging.getLogger("vaspy.script")
+
+if "__main__" == __name__:
+    # Set arguments parser.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", nargs="*", default=["."],
+                        help="job directories containing LOCPOT and OUTCAR")
+    parser.add_argument("--axis", default="z", help="surface normal axis")
+    parser.add_argument("--tol", type=float, default=0.01,
+                        help="gradient tolerance of vacuum plateau (eV/Angstrom)")
+    args = parser.parse_args()
+
+    _logger.info("{:<30s}{:>12s}{:>12s}{:>12s}".format("job", "vacuum", "E-fermi", "WF"))
+    _logger.info("-"*66)
+
+    for dirname in args.dirs:
+        try:
+            locpot = LocPot(os.path.join(dirname, "LOCPOT"), lazy=True)
+            outcar = OutCar(os.path.join(dirname, "OUTCAR"),
+                            poscar=os.path.join(dirname, "POSCAR"))
+            work_function = locpot.get_work_function(outcar, axis=args.axis,
+                                                     tol=args.tol)
+        except (ValueError, AttributeError) as e:
+            _logger.warning("{:<30s}{}".format(dirname, e))
+            continue
+
+        msg = "{:<30s}{:>12.4f}{:>12.4f}{:>12.4f}"
+        _logger.info(msg.format(dirname, locpot.vacuum_level, outcar.efermi,
+                                work_function))
@@ -68,7 +68,7 @@ Or install PyVista separately::
 install_requires = [
     'numpy>=1.11.1',
     'matplotlib>=1.5.2',
-    'scipy>=0.18.0',
+    'scipy>=1.6.0',
     'pyvista>=0.42.0',
 ]
 
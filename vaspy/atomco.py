@@ -119,21 +119,19 @@ class AtomCo(VasPy):
 
         return content
 
-    def get_poscar_content(self, **kwargs):
+    def get_lattice_content(self, title=None, **kwargs):
         """
-        Get POSCAR content.
-        根据对象数据获取poscar文件内容字符串
+        Get the POSCAR-like lines of title, lattice and atom info, shared
+        by POSCAR and volumetric data files.
+        获取poscar格式的标题, 晶格和原子信息行
 
         Parameters:
         -----------
-        bases_const: The constant for basis vectors, optional, 1.0 by default.
-
-        bases: The basis vectors for the lattice, option, 3x3 np.array.
-               [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]] by default.
+        title: The comment line, 'Created by VASPy' by default, str.
 
-        tf: The T/F info for all atoms. Nx3 np.array, n is the length of 0th axis of data.
+        bases_const, bases: See get_poscar_content.
         """
-        content = 'Created by VASPy\n'
+        content = ('Created by VASPy' if title is None else title) + '\n'
 
         # bases constant.
         try:
@@ -159,6 +157,26 @@ class AtomCo(VasPy):
         atom_types = ("{:>5s}"*len(types) + "\n").format(*types)
         atom_numbers = ("{:>5d}"*len(numbers) + "\n").format(*numbers)
 
+        content += bases_const + bases + atom_types + atom_numbers
+
+        return content
+
+    def get_poscar_content(self, **kwargs):
+        """
+        Get POSCAR content.
+        根据对象数据获取poscar文件内容字符串
+
+        Parameters:
+        -----------
+        bases_const: The constant for basis vectors, optional, 1.0 by default.
+
+        bases: The basis vectors for the lattice, option, 3x3 np.array.
+               [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]] by default.
+
+        tf: The T/F info for all atoms. Nx3 np.array, n is the length of 0th axis of data.
+        """
+        content = self.get_lattice_content(**kwargs)
+
         # Direct or Cartesian
         coord_type = kwargs.get('coord_type', 'direct')
 
@@ -185,8 +203,7 @@ class AtomCo(VasPy):
             data_tf += ("{:18.12f}"*3 + "{:>5s}"*3 + "\n").format(*(data+tf))
 
         # merge all strings
-        content += (bases_const + bases + atom_types + atom_numbers +
-                    info + data_tf)
+        content += info + data_tf
 
         return content
 
@@ -445,6 +462,7 @@ class PosCar(AtomCo):
           ============  =======================================================
           filename       string, name of the file the direct coordiante data
                          stored in
+          title          string, comment line of the file
           bases_const    float, lattice bases constant
           bases          np.array, bases of POSCAR
           natom          int, the number of total atom number
@@ -464,8 +482,17 @@ class PosCar(AtomCo):
     def load(self):
         """ Load all information in POSCAR.
         """
+        # Read only the header and coordinate lines, files like CHGCAR
+        # carry huge data blocks after them.
         with open(self.filename, 'r') as f:
-            content_list = f.readlines()
+            content_list = [f.readline() for i in range(8)]
+            if content_list[7][0] in 'Ss':
+                content_list.append(f.readline())
+            natom = sum(int(i) for i in str2list(content_list[6]))
+            content_list.extend(f.readline() for i in range(natom))
+
+        # comment line
+        title = content_list[0].rstrip('\r\n')
 
         # get scale factor
         bases_const = float(content_list[1])
@@ -515,6 +542,7 @@ class PosCar(AtomCo):
         tf = np.array(tf)
 
         # set class attrs
+        self.title = title
         self.bases_const = bases_const
         self.bases = bases
         self.atom_types = atom_types
@@ -10,7 +10,14 @@ Updated by PytLab <shaozhengjiang@gmail.com>, August 2016
 
 """
 import copy
+import glob
+import hashlib
+import itertools
 import logging
+import multiprocessing
+import os
+import tempfile
+from collections import namedtuple
 from string import whitespace
 
 import numpy as np
@@ -18,7 +25,9 @@ try:
     from scipy.integrate import simpson as simps
 except ImportError:
     from scipy.integrate import simps
-from scipy.interpolate import interp2d
+from scipy import ndimage
+from scipy import fft as scipy_fft
+from scipy.spatial import cKDTree
 import mpl_toolkits.mplot3d
 
 # whether pyplot installed
@@ -43,9 +52,12 @@ try:
 except ImportError:
     mayavi_installed = False
 
+from vaspy import LazyProperty
 from vaspy.plotter import DataPlotter
 from vaspy.atomco import PosCar
-from vaspy.functions import line2list
+from vaspy.errors import UnmatchedDataShape
+from vaspy.functions import line2list, file2array, skip_lines, pad_spectrum, \
+                            count_newlines, fill_from_file, window_weights
 
 
 class DosX(DataPlotter):
@@ -246,14 +258,292 @@ class DosX(DataPlotter):
         return dband_center
 
 
+# Values sampled on a plane and Cartesian coordinates of the points.
+PlaneSlice = namedtuple('PlaneSlice', ['values', 'points'])
+
+# Corners of a grid cell, corner (i, j, k) is numbered 4*i + 2*j + k.
+CELL_CORNERS = np.array([[i, j, k] for i in (0, 1) for j in (0, 1)
+                         for k in (0, 1)])
+
+# Kuhn decomposition of a cell into 6 tetrahedra along the main diagonal,
+# neighbouring cells are triangulated consistently.
+CELL_TETRAHEDRA = np.array([[0, 4 >> a, (4 >> a) | (4 >> b), 7]
+                            for a, b, _ in itertools.permutations(range(3))])
+
+# Membership of the cell corners in each tetrahedron, 6 x 8.
+TETRAHEDRON_CORNERS = np.zeros((6, 8), dtype=bool)
+TETRAHEDRON_CORNERS[np.arange(6)[:, None], CELL_TETRAHEDRA] = True
+
+# Edges (between corners sorted by value) cut by the isosurface, for 1, 2
+# and 3 corners below the isovalue. Triangles are closed by repeating the
+# first edge so the polygon area is |(C - A) x (D - B)| / 2 in all cases.
+ISO_EDGES = {1: np.array([[0, 1], [0, 2], [0, 3], [0, 1]]),
+             2: np.array([[0, 2], [0, 3], [1, 3], [1, 2]]),
+             3: np.array([[0, 3], [1, 3], [2, 3], [0, 3]])}
+
+
+class PeriodicView(object):
+    def __init__(self, data, widths):
+        """
+        Periodic replication of a 3D array without copying it, indices
+        of the expanded array are wrapped into the original one.
+
+        Example:
+
+        >>> view = PeriodicView(elf_data, (3, 3, 1))
+        >>> view.shape
+        (144, 144, 80)
+        >>> z = view[:, :, 40]  # only this slice is created
+
+        Parameters:
+        -----------
+        data: The original 3D array.
+
+        widths: Number of replication on x, y, z axis, tuple of int.
+        """
+        self.data = data
+        self.widths = tuple(widths)
+        self.shape = tuple(n*w for n, w in zip(data.shape, self.widths))
+        self.ndim = data.ndim
+        self.dtype = data.dtype
+
+    def __getitem__(self, key):
+        """
+        Support integers, slices and integer arrays on each axis.
+        """
+        if not isinstance(key, tuple):
+            key = (key, )
+        ellipses = [i for i, k in enumerate(key) if k is Ellipsis]
+        if ellipses:
+            i = ellipses[0]
+            nfill = self.ndim - len(key) + 1
+            key = key[:i] + (slice(None), )*nfill + key[i+1:]
+        key = key + (slice(None), )*(self.ndim - len(key))
+
+        # Map indices of the expanded array to the original one.
+        indices, arrays = [], []
+        for k, n, n0 in zip(key, self.shape, self.data.shape):
+            if isinstance(k, slice):
+                k = np.arange(*k.indices(n))
+            if np.ndim(k) == 0:
+                if not -n <= k < n:
+                    raise IndexError("index {} out of bounds for size {}".format(k, n))
+                indices.append(k % n0)
+            else:
+                arrays.append(len(indices))
+                indices.append(np.asarray(k) % n0)
+
+        # Outer product of array indices.
+        for i, ix in zip(arrays, np.ix_(*[indices[i] for i in arrays])):
+            indices[i] = ix
+
+        return self.data[tuple(indices)]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.tile(self.data, self.widths)
+        return data if dtype is None else data.astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+
+class SliceInterpolator(object):
+    def __init__(self, z, method='fourier'):
+        """
+        Periodic interpolation of 2D data on a regular grid which covers
+        exactly one period on both axes, e.g. a slice of ELFCAR data.
+
+        Example:
+
+        >>> interp = SliceInterpolator(elf_data[:, :, 10])
+        >>> newz = interp((600, 600))
+
+        Parameters:
+        -----------
+        z: 2D array, values on the grid.
+
+        method: 'fourier' for Fourier (zero-padding) interpolation,
+                'cubic' for periodic cubic spline interpolation, str.
+        """
+        if method == 'fourier':
+            coeffs = np.fft.fft2(z)
+        elif method == 'cubic':
+            coeffs = ndimage.spline_filter(z, order=3, mode='grid-wrap')
+        else:
+            raise ValueError('Unrecognized interpolation method : ' + method)
+
+        self.shape = z.shape
+        self.method = method
+        self.coeffs = coeffs
+
+    def __call__(self, shape):
+        """
+        Get interpolated values on a regular grid covering [0, n0] x [0, n1],
+        both ends of the period are included.
+
+        Parameters:
+        -----------
+        shape: Number of points on the two axes, tuple of int.
+        """
+        n0, n1 = self.shape
+        m0, m1 = shape
+        if self.method == 'fourier':
+            # Sample one period without ends, then wrap.
+            coeffs = pad_spectrum(self.coeffs, m0 - 1, axis=0)
+            coeffs = pad_spectrum(coeffs, m1 - 1, axis=1)
+            newz = np.fft.ifft2(coeffs).real*((m0 - 1)*(m1 - 1)/(n0*n1))
+            newz = np.pad(newz, ((0, 1), (0, 1)), mode='wrap')
+        else:
+            x, y = np.meshgrid(np.linspace(0, n0, m0), np.linspace(0, n1, m1),
+                               indexing='ij')
+            newz = ndimage.map_coordinates(self.coeffs, [x, y], order=3,
+                                           mode='grid-wrap', prefilter=False)
+
+        return newz
+
+
+class GridWriter(object):
+    def __init__(self, f, nvalue=5, batch_size=1 << 20):
+        """
+        Writer of volumetric data in VASP's layout, data can be written
+        chunk by chunk in Fortran order, lines are continued across chunks.
+        Values are formatted as ' 0.12345678901E+01' by vectorized
+        operations, so writing is not bound by formatting.
+
+        Example:
+
+        >>> with open('CHGCAR_new', 'wb') as f:
+        ...     writer = GridWriter(f)
+        ...     for chunk in chunks:
+        ...         writer.write(chunk.ravel(order='F'))
+        ...     writer.close()
+
+        Parameters:
+        -----------
+        f: File object opened in binary mode.
+
+        nvalue: Number of values in a line, int.
+
+        batch_size: Maximum number of values formatted at once, int.
+        """
+        self.f = f
+        self.nvalue = nvalue
+        self.batch_size = batch_size - batch_size % nvalue
+        self.remainder = np.empty(0)
+
+    @staticmethod
+    def format_lines(values, nvalue):
+        """
+        Format values to lines of `nvalue` fixed-width (18 chars) numbers
+        like VASP does, e.g. ' 0.12345678901E+01' and ' -.12345678901E-02'.
+        Number of values must be a multiple of `nvalue`, returns bytes.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not np.all(np.isfinite(values)):
+            raise ValueError('Can not format NaN or infinite values.')
+
+        # Exponents have 2 digits.
+        absv = np.abs(values)
+        absv[absv < 1e-99] = 0.0
+        if np.any(absv >= 1e98):
+            raise ValueError('Can not format values larger than 1e98.')
+
+        # 11 digits mantissa and exponent: 0.12345678901E+01
+        nonzero = absv > 0.0
+        e = np.zeros(values.shape, dtype=np.int64)
+        e[nonzero] = np.floor(np.log10(absv[nonzero])).astype(np.int64) + 1
+        m = np.rint(absv*10.0**(11 - e)).astype(np.int64)
+        over = m >= 10**11
+        e[over] += 1
+        m[over] = np.rint(absv[over]*10.0**(11 - e[over]))
+        under = nonzero & (m < 10**10)
+        e[under] -= 1
+        m[under] = np.rint(absv[under]*10.0**(11 - e[under]))
+        m = np.minimum(m, 10**11 - 1)
+        e[~nonzero] = 0
+
+        # Build the 18 chars of each value as 9 two-char words.
+        pairs = np.frombuffer(''.join('{:02d}'.format(i) for i in range(100)).encode(),
+                              dtype=np.uint16)
+        words = np.empty((values.size, 9), dtype=np.uint16)
+        words[:, 0] = np.where(values < 0.0, *np.frombuffer(b' - 0', dtype=np.uint16))
+        hi = (m//10**5).astype(np.int32)  # the first 6 digits
+        lo = (m % 10**5).astype(np.int32)  # the last 5 digits
+        words[:, 1] = np.frombuffer(b'.0.1.2.3.4.5.6.7.8.9', dtype=np.uint16)[hi//10**5]
+        hi %= 10**5
+        words[:, 2] = pairs[hi//1000]
+        words[:, 3] = pairs[hi//10 % 100]
+        words[:, 4] = pairs[hi % 10*10 + lo//10**4]
+        words[:, 5] = pairs[lo//100 % 100]
+        words[:, 6] = pairs[lo % 100]
+        words[:, 7] = np.where(e < 0, *np.frombuffer(b'E-E+', dtype=np.uint16))
+        words[:, 8] = pairs[np.abs(e)]
+
+        # Join values to lines.
+        lines = np.empty((values.size//nvalue, 18*nvalue + 1), dtype=np.uint8)
+        lines[:, :-1] = words.view(np.uint8).reshape(-1, 18*nvalue)
+        lines[:, -1] = ord('\n')
+
+        return lines.tobytes()
+
+    def write(self, values):
+        """
+        Write 1D array of values, values not filling a whole line are
+        kept until next write or close.
+        """
+        values = np.concatenate([self.remainder, np.ravel(values)])
+        nfull = values.size - values.size % self.nvalue
+        for start in range(0, nfull, self.batch_size):
+            end = min(start + self.batch_size, nfull)
+            self.f.write(self.format_lines(values[start: end], self.nvalue))
+        self.remainder = values[nfull:]
+
+    def close(self):
+        "Write the last incomplete line."
+        if self.remainder.size:
+            self.f.write(self.format_lines(self.remainder, self.remainder.size))
+        self.remainder = np.empty(0)
+
+
 class ElfCar(PosCar):
-    def __init__(self, filename='ELFCAR'):
+
+    # Names of data blocks in file.
+    blocks = ('elf_data', )
+
+    # Coarsest level of the downsampling pyramid (8x).
+    max_pyramid_level = 3
+
+    def __init__(self, filename='ELFCAR', lazy=False, cache=False, nprocs=1,
+                 dtype=np.float64):
         """
         Create a ELFCAR file class.
 
+        Parameters:
+        -----------
+        filename: File name of ELFCAR, default name is "ELFCAR".
+
+        lazy: Parse only the header and the grid line when created,
+              the volumetric data is loaded on its first access, bool.
+
+        cache: Keep the parsed volumetric data in a binary .npy sidecar
+               file next to the ELFCAR and memory-map it on later opens,
+               bool.
+
+        nprocs: Number of processes to parse the volumetric data, the
+                data block is split on line boundaries and parsed
+                concurrently if larger than 1, int.
+
+        dtype: Data type of the volumetric data and its cache, e.g.
+               np.float32 to halve the memory, reductions are still
+               accumulated in float64, default is np.float64.
+
         Example:
 
         >>> a = ElfCar()
+        >>> b = ElfCar('ELFCAR', lazy=True)
+        >>> c = ElfCar('ELFCAR', cache=True)
+        >>> d = ElfCar('ELFCAR', nprocs=8)
+        >>> e = ElfCar('ELFCAR', dtype=np.float32)
 
         Class attributes descriptions
         ==============================================================
@@ -270,36 +560,615 @@ class ElfCar(PosCar):
           tf               list of list, T&F info of atoms
           data             np.array, coordinates of atoms, dtype=float64
           -------------    ame as PosCar ------------
+          grid             tuple of int, (NGX, NGY, NGZ)
+          data_offset      int, byte offset of the volumetric data
+          block_offsets    list of int, byte offsets of all data blocks
+          aug_offsets      list of list, index of augmentation sections
+          dtype            np.dtype, data type of volumetric data
           elf_data         3d array
           plot_contour     method, use matplotlib to plot contours
           plot_mcontours   method, use PyVista to plot beautiful contour
           plot_contour3d   method, use PyVista to plot 3d contour
           plot_field       method, plot scalar field for elf data
+          slice_plane      method, sample data on an arbitrary plane
+          probe            method, interpolate data at many points
+          get_isosurface_measures
+                           method, volume and area of isosurfaces
+          get_pyramid_level
+                           method, downsampled data for interactive plots
+          planar_average   method, planar averaged data along an axis
+          macroscopic_average
+                           method, macroscopic average along an axis
+          tofile           method, write data to CHGCAR-like file
           ==============  =============================================
         """
-        super(ElfCar, self).__init__(filename)
+        self.lazy = lazy
+        self.cache = cache
+        self.nprocs = nprocs
+        self.dtype = np.dtype(dtype)
+        self.__slice_interps = {}  # interpolants of 2D slices
+        self.__pyramid = {}  # downsampled data blocks
+        self.__pvgrids = {}  # geometry of pyvista grids
+        self.__cell_bounds = {}  # min/max of data in grid cells
+        self.__spline_coeffs = {}  # prefiltered data for cubic splines
 
         # Set logger.
         self.__logger = logging.getLogger("vaspy.ElfCar")
 
+        super(ElfCar, self).__init__(filename)
+
     def load(self):
         "Rewrite load method"
         PosCar.load(self)
-        with open(self.filename, 'r') as f:
+        with open(self.filename, 'rb') as f:
             for i in range(self.totline):
                 f.readline()
             #get dimension of 3d array
-            grid = f.readline().strip(whitespace)
+            grid = f.readline().strip(whitespace.encode())
             empty = not grid  # empty row
             while empty:
-                grid = f.readline().strip(whitespace)
+                grid = f.readline().strip(whitespace.encode())
                 empty = not grid
-            x, y, z = line2list(grid, dtype=int)
-            #read electron localization function data
-            elf_data = []
-            for line in f:
-                datalist = line2list(line)
-                elf_data.extend(datalist)
+            x, y, z = line2list(grid.decode(), dtype=int)
+            #set attrs
+            self.grid = x, y, z
+            self.data_offset = f.tell()
+        #read electron localization function data
+        if not self.lazy:
+            self.elf_data = self.load_block('elf_data', self.data_offset)
+
+        return
+
+    @LazyProperty
+    def elf_data(self):
+        """
+        Volumetric data in file, only loaded when first accessed
+        in lazy mode.
+        """
+        return self.load_block('elf_data', self.data_offset)
+
+    @LazyProperty
+    def block_offsets(self):
+        """
+        Byte offsets of all volumetric data blocks in file, e.g. the total
+        density and the magnetization density in a spin-polarized CHGCAR.
+        """
+        self.__index_blocks()
+        return self.block_offsets
+
+    @LazyProperty
+    def aug_offsets(self):
+        """
+        Index of augmentation occupancies sections following each data
+        block, list of list of (atom number, value number, byte offset).
+        """
+        self.__index_blocks()
+        return self.aug_offsets
+
+    def __index_blocks(self):
+        """
+        Private helper function to index data blocks and augmentation
+        occupancies sections in file. Sections are located by skipping
+        lines, no data is parsed.
+        """
+        block_offsets = [self.data_offset]
+        aug_offsets = [[]]
+        ngrid = int(np.prod(self.grid))
+
+        with open(self.filename, 'rb') as f:
+            f.seek(self.data_offset)
+            while True:
+                # Pass the current data block.
+                nvalue = len(f.readline().split())  # values in a line
+                nline = -(-ngrid // nvalue)
+                try:
+                    skip_lines(f, nline - 1)
+                except EOFError:
+                    break
+
+                # Find grid line of the next block.
+                for line in iter(f.readline, b''):
+                    if line.startswith(b'augmentation occupancies'):
+                        # augmentation occupancies   1  15
+                        iatom, nvalue = [int(i) for i in line.split()[2:4]]
+                        offset = f.tell()
+                        aug_offsets[-1].append((iatom, nvalue, offset))
+                        nline = -(-nvalue // len(f.readline().split()))
+                        skip_lines(f, nline - 1)
+                    elif self.__is_grid_line(line):
+                        block_offsets.append(f.tell())
+                        aug_offsets.append([])
+                        break
+                else:
+                    break
+
+        self.block_offsets = block_offsets
+        self.aug_offsets = aug_offsets
+
+    def __is_grid_line(self, line):
+        """
+        Private helper function to check if a line is the NGX/NGY/NGZ
+        line of a data block.
+        """
+        items = line.split()
+        if len(items) != 3 or not all(i.isdigit() for i in items):
+            return False
+
+        return tuple(int(i) for i in items) == self.grid
+
+    def load_block(self, name, offset):
+        """
+        Load the volumetric data block starting at byte `offset`.
+
+        If cache is enabled, the block is memory-mapped from its sidecar
+        file when a valid one exists, otherwise the block is parsed
+        and the sidecar file is written.
+
+        Parameters:
+        -----------
+        name: Name of the data block, used in the sidecar file name, str.
+
+        offset: Byte offset of the data block in file, int.
+        """
+        if self.cache:
+            cache_name = self.get_cache_name(name)
+            if os.path.exists(cache_name):
+                self.__logger.debug('memory-map %s from %s', name, cache_name)
+                return np.load(cache_name, mmap_mode='r')
+
+        if self.nprocs > 1:
+            data = self.read_grid_parallel(self.filename, offset, self.grid,
+                                           self.nprocs, self.dtype)
+        else:
+            with open(self.filename, 'rb') as f:
+                f.seek(offset)
+                data = self.read_grid(f, self.grid, self.dtype)
+
+        if self.cache:
+            self.__write_cache(cache_name, data)
+
+        return data
+
+    def iter_chunks(self, name='elf_data', nlayer=16):
+        """
+        Iterate over a data block in chunks of layers along z axis (NGZ).
+
+        If the block is not loaded, chunks are streamed from file (or its
+        sidecar cache), so the whole grid is never held in memory.
+
+        Parameters:
+        -----------
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+
+        nlayer: Number of z layers in each chunk, int.
+
+        Returns:
+        --------
+        A generator yield index of the first layer and the chunk,
+        a NGX x NGY x nlayer array.
+        """
+        nx, ny, nz = self.grid
+        loaded = (name in self.__dict__ or
+                  (self.cache and os.path.exists(self.get_cache_name(name))))
+        if loaded:
+            data = getattr(self, name)
+            for start in range(0, nz, nlayer):
+                yield start, data[:, :, start: start+nlayer]
+            return
+
+        if name == 'elf_data':
+            offset = self.data_offset
+        else:
+            offset = self.block_offsets[self.blocks.index(name)]
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            for start in range(0, nz, nlayer):
+                n = min(nlayer, nz - start)
+                chunk = file2array(f, nx*ny*n, dtype=self.dtype)
+                yield start, chunk.reshape((nx, ny, n), order='F')
+
+    def get_layer_distance(self, axis='z'):
+        """
+        Get the distance between the two lattice planes perpendicular to
+        an axis, e.g. thickness of the slab along the surface normal.
+
+        Parameters:
+        -----------
+        axis: 'x', 'y' or 'z', for lattice vector a, b or c, str.
+        """
+        iaxis = 'xyz'.index(axis.lower())
+        bases = self.bases*self.bases_const
+        volume = abs(np.linalg.det(bases))
+        area = np.linalg.norm(np.cross(*np.delete(bases, iaxis, axis=0)))
+
+        return volume/area
+
+    def planar_average(self, axis='z', name='elf_data', nlayer=16):
+        """
+        Get planar averaged data along an axis, e.g. charge density or
+        potential profile along the surface normal. Data is streamed in
+        chunks when it is not loaded.
+
+        Parameters:
+        -----------
+        axis: 'x', 'y' or 'z', axis of the profile, str.
+
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+
+        nlayer: Number of z layers in each streamed chunk, int.
+
+        Returns:
+        --------
+        Positions along the axis in Angstrom (distance to the lattice
+        plane through origin) and the planar averaged values.
+
+        Example:
+        --------
+        >>> z, values = a.planar_average('z')
+        """
+        iaxis = 'xyz'.index(axis.lower())
+        others = tuple(i for i in range(3) if i != iaxis)
+        values = np.zeros(self.grid[iaxis])
+
+        for start, chunk in self.iter_chunks(name, nlayer):
+            sums = np.sum(chunk, axis=others, dtype=np.float64)
+            if iaxis == 2:
+                values[start: start+chunk.shape[2]] = sums
+            else:
+                values += sums
+        values /= np.prod(self.grid)/self.grid[iaxis]
+
+        n = self.grid[iaxis]
+        positions = np.arange(n)*self.get_layer_distance(axis)/n
+
+        return positions, values
+
+    def macroscopic_average(self, periods, axis='z', name='elf_data',
+                            nlayer=16):
+        """
+        Get macroscopic average of planar averaged data, the planar average
+        is convolved periodically with a sliding window for each period.
+        The window is centered and covers exactly one period, points at
+        both ends of the window are weighted by the fraction inside it.
+
+        Parameters:
+        -----------
+        periods: Window widths in Angstrom, e.g. the interlayer distance of
+                 the bulk region, float or tuple of float for interfaces.
+
+        axis, name, nlayer: see planar_average.
+
+        Example:
+        --------
+        >>> z, values = a.macroscopic_average(2.27)
+        >>> z, values = a.macroscopic_average((2.27, 3.15))
+        """
+        positions, values = self.planar_average(axis, name, nlayer)
+        step = positions[1] - positions[0]
+
+        for period in np.atleast_1d(periods):
+            values = ndimage.convolve1d(values, window_weights(period/step),
+                                        mode='wrap')
+
+        return positions, values
+
+    def __get_cell_bounds(self, name):
+        """
+        Private helper function to get the cached index of minimum and
+        maximum of data in grid cells (the 8 corners, periodic) for
+        isosurface queries. The index is rebuilt if the data block is
+        replaced.
+
+        Cells are grouped by span (cmax - cmin) in halving ranges and
+        sorted by cmin in each group, so cells above an isovalue are
+        counted by binary search, and cells cut by it are found in the
+        cmin range [iso - span, iso) of each group.
+
+        Returns flat indices of cells in group order, their cmin and
+        cmax, offsets of groups and the maximum span in each group.
+        """
+        data = getattr(self, name)
+        cached = self.__cell_bounds.get(name)
+        if cached is None or cached[0] is not data:
+            cmin = cmax = np.asarray(data)
+            for axis in range(3):
+                cmin = np.minimum(cmin, np.roll(cmin, -1, axis=axis))
+                cmax = np.maximum(cmax, np.roll(cmax, -1, axis=axis))
+            cmin, cmax = cmin.ravel(), cmax.ravel()
+
+            # Group by binary exponent of span, the last group collects
+            # all small spans.
+            ngroup = 32
+            spans = cmax - cmin
+            exponents = np.frexp(spans)[1]
+            groups = np.clip(exponents.max() - exponents, 0, ngroup - 1)
+            groups = groups.astype(np.uint8)
+
+            cells = np.argsort(cmin, kind='stable')
+            cells = cells[np.argsort(groups[cells], kind='stable')]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(groups, minlength=ngroup))])
+            spans = spans[cells]
+            group_spans = np.array([spans[i: j].max() if j > i else 0.0
+                                    for i, j in zip(offsets[:-1], offsets[1:])])
+            self.__cell_bounds[name] = (data, cells, cmin[cells], cmax[cells],
+                                        offsets, group_spans)
+
+        return self.__cell_bounds[name][1:]
+
+    def get_isosurface_measures(self, isovalues, name='elf_data',
+                                batch_size=1 << 16):
+        """
+        Get the volume enclosed by isosurfaces (data >= isovalue) and the
+        isosurface areas without a renderer.
+
+        Data in each grid cell is interpolated linearly on 6 tetrahedra.
+        The volume counts whole cells above the isovalue and adds the
+        exact fraction above the isovalue in cells cut by the isosurface,
+        the area is summed over the marching tetrahedra polygons. An
+        index of cell bounds is built once, whole cells and cut cells are
+        then found by binary search. Isovalues are visited in sorted
+        order, each cut cell is read and sorted once for all isovalues
+        cutting it, so sweeping many isovalues is cheap.
+
+        Parameters:
+        -----------
+        isovalues: Isovalue or sequence of isovalues, float.
+
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+
+        batch_size: Number of (cut cell, isovalue) pairs processed at a
+                    time, int.
+
+        Returns:
+        --------
+        Volumes in Angstrom^3 and areas in Angstrom^2, float or 1D array
+        in the same shape of isovalues.
+
+        Example:
+        --------
+        >>> volume, area = a.get_isosurface_measures(0.8)
+        >>> volumes, areas = a.get_isosurface_measures(np.linspace(0.1, 0.9, 50))
+        """
+        data = getattr(self, name)
+        cells, cmins, cmaxs, offsets, spans = self.__get_cell_bounds(name)
+        grid = np.array(self.grid)
+
+        # Cartesian vectors of grid steps, cross products of vectors in
+        # grid steps are transformed to Cartesian ones by the cofactors.
+        steps = self.bases*self.bases_const/grid[:, None]
+        cell_volume = abs(np.linalg.det(steps))
+        cofactors = np.linalg.det(steps)*np.linalg.inv(steps).T
+
+        scalar = np.ndim(isovalues) == 0
+        isovalues = np.asarray(isovalues, dtype=np.float64)
+        iso_order = np.argsort(isovalues, axis=None)
+        isos = isovalues.ravel()[iso_order]
+        ncells = np.zeros(isos.shape)
+        areas = np.zeros(isos.shape)
+
+        # Whole cells above isovalues and candidates of cut cells, the
+        # windows of sorted isovalues are merged in each group.
+        candidates = []
+        for start, end, span in zip(offsets[:-1], offsets[1:], spans):
+            if end == start:
+                continue
+            group = cmins[start: end]
+            lo = np.searchsorted(group, isos - span, 'left')
+            hi = np.searchsorted(group, isos, 'left')
+            ncells += (end - start) - hi
+            breaks = lo[1:] > hi[:-1]
+            for i, j in zip(lo[np.r_[True, breaks]], hi[np.r_[breaks, True]]):
+                if j > i:
+                    candidates.append(np.arange(start + i, start + j))
+        candidates = np.concatenate(candidates) if candidates else np.array([], dtype=int)
+
+        # Cell cut by isovalues in [first, last), cmin < iso <= cmax.
+        first = np.searchsorted(isos, cmins[candidates], 'right')
+        last = np.searchsorted(isos, cmaxs[candidates], 'right')
+        cut = last > first
+        cut_cells = cells[candidates[cut]]
+        first, counts = first[cut], (last - first)[cut]
+        npairs = np.cumsum(counts)
+
+        start = 0
+        while start < cut_cells.size:
+            end = np.searchsorted(npairs, npairs[start] - counts[start] + batch_size, 'right')
+            end = max(end, start + 1)
+            batch = slice(start, end)
+            start = end
+
+            idx = np.unravel_index(cut_cells[batch], self.grid)
+            corners = [(i[:, None] + c[None, :]) % size
+                       for i, c, size in zip(idx, CELL_CORNERS.T, grid)]
+            values = np.asarray(data[tuple(corners)], dtype=np.float64)
+
+            # Sort corners of each cell once, corners of a tetrahedron
+            # taken in this order are sorted by value too.
+            order = np.argsort(values, axis=1).astype(np.int8)
+            values = np.take_along_axis(values, order, axis=1)
+            ncut = order.shape[0]
+            in_tet = TETRAHEDRON_CORNERS[:, order].swapaxes(0, 1)  # ncut x 6 x 8
+            tet_corners = np.broadcast_to(order[:, None], in_tet.shape)[in_tet]
+            tet_corners = tet_corners.reshape(ncut, 6, 4)
+            tet_values = np.broadcast_to(values[:, None], in_tet.shape)[in_tet]
+            tet_values = tet_values.reshape(ncut, 6, 4)
+            # Corners of tetrahedra among the first r sorted corners.
+            nbelow_table = np.zeros((ncut, 6, 9), dtype=np.int8)
+            np.cumsum(in_tet, axis=2, out=nbelow_table[:, :, 1:])
+
+            # All (cell, isovalue) pairs, isovalues cutting a cell are in
+            # a contiguous range of sorted isovalues.
+            k = counts[batch]
+            pair_cells = np.repeat(np.arange(ncut), k)
+            pair_isos = (np.arange(pair_cells.size) - np.repeat(np.cumsum(k) - k, k)
+                         + np.repeat(first[batch], k))
+            iso = isos[pair_isos]
+            rank = np.count_nonzero(values[pair_cells] < iso[:, None], axis=1)
+            nbelow = nbelow_table[pair_cells[:, None], np.arange(6), rank[:, None]]
+
+            # Tetrahedra above the isovalue.
+            nfull = np.count_nonzero(nbelow == 0, axis=1)
+            ncells += np.bincount(pair_isos, nfull, minlength=isos.size)/6.0
+
+            # Tetrahedra cut by the isosurface, grouped by corners below.
+            pairs, tets = np.nonzero((nbelow > 0) & (nbelow < 4))
+            nbs = nbelow[pairs, tets]
+            grouped = np.argsort(nbs, kind='stable')
+            pairs, tets = pairs[grouped], tets[grouped]
+            bounds = np.cumsum(np.bincount(nbs, minlength=4))
+            tet_idx = pair_cells[pairs]*6 + tets
+            s_all = tet_values.reshape(-1, 4).take(tet_idx, axis=0)
+            corners_all = tet_corners.reshape(-1, 4).take(tet_idx, axis=0)
+            iso_idx, iso_all = pair_isos[pairs], iso[pairs]
+
+            for nb in (1, 2, 3):
+                group = slice(bounds[nb-1], bounds[nb])
+                s, iso_t, c = s_all[group], iso_all[group], corners_all[group]
+
+                # Fractions of cut edges below the isovalue.
+                edges = ISO_EDGES[nb]
+                s0, s1 = s[:, edges[:, 0]], s[:, edges[:, 1]]
+                t = (iso_t[:, None] - s0)/(s1 - s0)
+
+                # Volume fraction above isovalue.
+                if nb == 1:
+                    above = 1.0 - t[:, 0]*t[:, 1]*t[:, 2]
+                elif nb == 2:
+                    a2, a3, b3, b2 = t.T
+                    above = 1.0 - (a2*a3 + a3*b2*(1.0 - a2) + (1.0 - a3)*b2*b3)
+                else:
+                    above = (1.0 - t[:, 0])*(1.0 - t[:, 1])*(1.0 - t[:, 2])
+                ncells += np.bincount(iso_idx[group], above, minlength=isos.size)/6.0
+
+                # Area of the isosurface polygon, cut points are found in
+                # grid steps from bits of corner numbers.
+                c0, c1 = c[:, edges[:, 0]], c[:, edges[:, 1]]
+                diagonals = []
+                for bit in (2, 1, 0):
+                    x0, x1 = (c0 >> bit) & 1, (c1 >> bit) & 1
+                    x = x0 + t*(x1 - x0)
+                    diagonals.append((x[:, 2] - x[:, 0], x[:, 3] - x[:, 1]))
+                (ux, vx), (uy, vy), (uz, vz) = diagonals
+                cross = np.stack([uy*vz - uz*vy, uz*vx - ux*vz, ux*vy - uy*vx], axis=1)
+                cross = np.dot(cross, cofactors)
+                area = 0.5*np.sqrt(np.einsum('ij,ij->i', cross, cross))
+                areas += np.bincount(iso_idx[group], area, minlength=isos.size)
+
+        # Back to the order of isovalues.
+        measures = np.empty((2, isos.size))
+        measures[:, iso_order] = ncells*cell_volume, areas
+        volumes, areas = measures.reshape((2, ) + isovalues.shape)
+        if scalar:
+            return volumes[()], areas[()]
+        return volumes, areas
+
+    @LazyProperty
+    def cache_key(self):
+        """
+        Key of the sidecar cache files, built from size, mtime and
+        a SHA1 hash of the leading and trailing 1 MB of the file.
+        """
+        stat = os.stat(self.filename)
+        sha1 = hashlib.sha1()
+        sha1.update('{}:{}:'.format(stat.st_size, stat.st_mtime_ns).encode())
+        with open(self.filename, 'rb') as f:
+            sha1.update(f.read(1 << 20))
+            f.seek(max(stat.st_size - (1 << 20), 0))
+            sha1.update(f.read())
+
+        return sha1.hexdigest()[:16]
+
+    def get_header_content(self):
+        """
+        Get the POSCAR-like header and grid line of the volumetric file,
+        the title of the file is kept.
+        """
+        content = self.get_lattice_content(title=self.title)
+        content += "Direct\n"
+        for coord in self.data.tolist():
+            content += ("{:18.12f}"*3 + "\n").format(*coord)
+        content += "\n{:>5d}{:>5d}{:>5d}\n".format(*self.grid)
+
+        return content
+
+    def tofile(self, filename=None, name='elf_data', nlayer=16):
+        """
+        Write the header and a data block to a CHGCAR-like file, data is
+        formatted and written in chunks of z layers, 5 values per line.
+
+        Parameters:
+        -----------
+        filename: Name of the output file, filename + '_c' by default, str.
+
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+
+        nlayer: Number of z layers in each chunk, int.
+
+        Example:
+        --------
+        >>> a.elf_data *= 2.0
+        >>> a.tofile('CHGCAR_new')
+        """
+        if filename is None:
+            filename = self.filename + '_c'
+        if (os.path.abspath(filename) == os.path.abspath(self.filename) and
+                name not in self.__dict__):
+            raise ValueError('Can not stream data into the file itself.')
+
+        with open(filename, 'wb') as f:
+            f.write(self.get_header_content().encode())
+            writer = GridWriter(f)
+            for _, chunk in self.iter_chunks(name, nlayer):
+                writer.write(chunk.ravel(order='F'))
+            writer.close()
+
+        return
+
+    def get_cache_name(self, name):
+        """
+        Get the sidecar cache file name of a data block.
+
+        >>> a.get_cache_name('elf_data')
+        'ELFCAR.elf_data.3f5e8c6b0a1d2e4f.float64.npy'
+        """
+        return '{}.{}.{}.{}.npy'.format(self.filename, name, self.cache_key,
+                                        self.dtype.name)
+
+    def __write_cache(self, cache_name, data):
+        """
+        Private helper function to write data block to sidecar file,
+        stale sidecar files of the same block are removed.
+        """
+        prefix = cache_name.rsplit('.', 3)[0] + '.'
+        tmp_name = cache_name + '.tmp'
+        try:
+            # Keep sidecar files in other dtypes of the same key.
+            for stale_name in glob.glob(glob.escape(prefix) + '*.npy'):
+                if not stale_name.startswith(prefix + self.cache_key + '.'):
+                    os.remove(stale_name)
+            with open(tmp_name, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_name, cache_name)
+        except OSError as e:
+            self.__logger.warning('Failed to write cache %s: %s', cache_name, e)
+
+    @staticmethod
+    def read_grid(f, grid, dtype=np.float64):
+        """
+        Read a volumetric data block from the current position of a binary
+        file object.
+
+        The NGX*NGY*NGZ values are parsed in one pass into a preallocated
+        array, the file is left positioned right after the block.
+
+        Parameters:
+        -----------
+        f: File object opened in binary mode.
+
+        grid: The grid size (NGX, NGY, NGZ), tuple of int.
+
+        dtype: Data type of the returned array, default is np.float64.
+        """
         #########################################
         #                                       #
         #           !!! Notice !!!              #
@@ -308,62 +1177,474 @@ class ElfCar(PosCar):
         # NGZ is the length of the **2nd** axis #
         #                                       #
         #########################################
-        #reshape to 3d array
-        elf_data = np.array(elf_data).reshape((x, y, z), order='F')
-        #set attrs
-        self.grid = x, y, z
-        self.elf_data = elf_data
+        x, y, z = grid
+        data = file2array(f, x*y*z, dtype=dtype)
 
-        return
+        #reshape to 3d array (a view, no copy)
+        return data.reshape((x, y, z), order='F')
+
+    @staticmethod
+    def read_grid_parallel(filename, offset, grid, nprocs, dtype=np.float64):
+        """
+        Read a volumetric data block starting at byte `offset` of a file
+        with a pool of `nprocs` processes.
+
+        The block is split into byte ranges on line boundaries, the
+        workers first count the lines in each range to locate where its
+        values belong, then parse their ranges into a shared file-backed
+        array (in /dev/shm if it has enough room) which is returned as
+        the data without a final copy. Where a mapped file can't be
+        removed (Windows), the data are copied into memory instead.
+
+        Parameters:
+        -----------
+        filename: Name of the file, str.
+
+        offset: Byte offset of the data block in file, int.
+
+        grid: The grid size (NGX, NGY, NGZ), tuple of int.
+
+        nprocs: Number of worker processes, int.
+
+        dtype: Data type of the returned array, default is np.float64.
+        """
+        x, y, z = grid
+        ngrid = x*y*z
+
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            first = f.readline()
+            nvalue = len(first.split())  # values in a line
+            nline = -(-ngrid // nvalue)
+            filesize = os.fstat(f.fileno()).st_size
+
+            def split(end):
+                # Line-aligned byte ranges covering [offset, end).
+                bounds = [offset]
+                for i in range(1, nprocs + 1):
+                    pos = offset + (end - offset)*i//nprocs
+                    if pos < filesize:
+                        f.seek(pos)
+                        f.readline()
+                        pos = f.tell()
+                    if pos > bounds[-1]:
+                        bounds.append(pos)
+                return list(zip(bounds[:-1], bounds[1:]))
+
+            # Lines in a data block have the same width mostly, estimate
+            # the end of block to avoid scanning following blocks.
+            end = min(offset + nline*len(first)*11//10 + len(first), filesize)
+            ranges = split(end)
+
+        ctx = multiprocessing.get_context()
+        with ctx.Pool(min(nprocs, len(ranges))) as pool:
+            nlines = pool.starmap(count_newlines,
+                                  [(filename, s, e) for s, e in ranges])
+            if sum(nlines) < nline and end < filesize:
+                # The estimation is too short, count lines in whole file.
+                with open(filename, 'rb') as f:
+                    ranges = split(filesize)
+                nlines = pool.starmap(count_newlines,
+                                      [(filename, s, e) for s, e in ranges])
+
+            # Shared array backed by a temporary file.
+            logger = logging.getLogger("vaspy.ElfCar")
+            nbytes = ngrid*np.dtype(dtype).itemsize
+            shm_dir = None
+            if os.path.isdir('/dev/shm'):
+                st = os.statvfs('/dev/shm')
+                if st.f_bavail*st.f_frsize > nbytes:
+                    shm_dir = '/dev/shm'
+                else:
+                    logger.warning("Not enough room in /dev/shm for %d bytes, "
+                                   "use a temporary file on disk", nbytes)
+            fd, shared_name = tempfile.mkstemp(prefix='vaspy-', dir=shm_dir)
+            data = None
+            try:
+                os.ftruncate(fd, nbytes)
+                os.close(fd)
+                data = np.memmap(shared_name, dtype=dtype, mode='r+',
+                                 shape=(ngrid, ))
+
+                # Values in each range, the last line of file may have
+                # no newline.
+                tasks = []
+                start = 0
+                for (s, e), n in zip(ranges, nlines):
+                    if start >= ngrid:
+                        break
+                    stop = start + n*nvalue
+                    if stop > ngrid or e == filesize:
+                        stop = ngrid
+                    if stop > start:
+                        tasks.append((filename, s, stop - start,
+                                      shared_name, start, ngrid, dtype))
+                    start = stop
+                if start < ngrid:
+                    msg = "Expect {} values in {}, but only {} found."
+                    raise UnmatchedDataShape(msg.format(ngrid, filename, start))
+
+                pool.starmap(fill_from_file, tasks)
+            finally:
+                # The mapping is still valid after the file is removed.
+                try:
+                    os.remove(shared_name)
+                except OSError:
+                    # A mapped file can't be removed on some platforms,
+                    # copy the data into memory to release the mapping.
+                    if data is not None:
+                        data = np.array(data)
+                    try:
+                        os.remove(shared_name)
+                    except OSError:
+                        logger.warning("Failed to remove temporary file %s",
+                                       shared_name)
+
+        #reshape to 3d array (a view, no copy)
+        return data.reshape((x, y, z), order='F')
 
     @staticmethod
     def expand_data(data, grid, widths):
         '''
         根据widths, 将三维矩阵沿着x, y, z轴方向进行扩展.
+        Replicate 3D data along x, y, z axis, the expanded data is
+        allocated only once. Use PeriodicView to avoid the allocation.
         '''
         # expand grid
         widths = np.array(widths)
         expanded_grid = np.array(grid)*widths  # expanded grid
-        # expand eld_data matrix
-        expanded_data = copy.deepcopy(data)
-        nx, ny, nz = widths
-        # x axis
-        added_data = copy.deepcopy(expanded_data)
-        for i in range(nx - 1):
-            expanded_data = np.append(expanded_data, added_data, axis=0)
-        # y axis
-        added_data = copy.deepcopy(expanded_data)
-        for i in range(ny - 1):
-            expanded_data = np.append(expanded_data, added_data, axis=1)
-        # z axis
-        added_data = copy.deepcopy(expanded_data)
-        for i in range(nz - 1):
-            expanded_data = np.append(expanded_data, added_data, axis=2)
+        # expand elf_data matrix
+        expanded_data = np.tile(data, widths)
 
         return expanded_data, expanded_grid
 
-    def _build_structured_grid(self, data, grid):
+    @staticmethod
+    def downsample(data):
+        '''
+        Average periodic 3D data in 2 x 2 x 2 blocks, an axis of odd
+        length is wrapped with its first plane before averaging.
+        '''
+        for axis, n in enumerate(data.shape):
+            if n % 2:
+                first = np.take(data, [0], axis=axis)
+                data = np.concatenate([data, first], axis=axis)
+
+        # Sum pairs along each axis, the first sum halves the size.
+        sl = [slice(None)]*3
+        even, odd = list(sl), list(sl)
+        even[0], odd[0] = slice(0, None, 2), slice(1, None, 2)
+        sums = np.add(data[tuple(even)], data[tuple(odd)], dtype=np.float64)
+        for axis in (1, 2):
+            even, odd = list(sl), list(sl)
+            even[axis], odd[axis] = slice(0, None, 2), slice(1, None, 2)
+            sums = sums[tuple(even)] + sums[tuple(odd)]
+
+        return (sums/8.0).astype(data.dtype)
+
+    def get_pyramid_level(self, level, name='elf_data'):
+        """
+        Get a level of the downsampling pyramid of a data block, level k
+        is the data averaged in 2^k x 2^k x 2^k blocks and level 0 is the
+        data itself. Levels are built from the previous one and cached,
+        they are rebuilt if the data block is replaced, call
+        clear_pyramid after modifying the data in place.
+
+        Parameters:
+        -----------
+        level: Level of the pyramid, 0 ~ max_pyramid_level, int.
+
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+        """
+        if not 0 <= level <= self.max_pyramid_level:
+            msg = "level must be in 0 ~ {}".format(self.max_pyramid_level)
+            raise ValueError(msg)
+        data = getattr(self, name)
+        if level == 0:
+            return data
+
+        key = (name, level)
+        cached = self.__pyramid.get(key)
+        if cached is None or cached[0] is not data:
+            coarse = self.downsample(self.get_pyramid_level(level - 1, name))
+            self.__pyramid[key] = (data, coarse)
+
+        return self.__pyramid[key][1]
+
+    def get_pyramid_coords(self, level):
+        """
+        Get fractional coordinates of the points of a pyramid level along
+        x, y, z axis. A point of a coarse level is at the center of the
+        block it averages, including the periodic image of the first
+        plane wrapped to an axis of odd length.
+
+        Parameters:
+        -----------
+        level: Level of the pyramid, 0 ~ max_pyramid_level, int.
+        """
+        if not 0 <= level <= self.max_pyramid_level:
+            msg = "level must be in 0 ~ {}".format(self.max_pyramid_level)
+            raise ValueError(msg)
+
+        coords = [np.arange(n)/float(n) for n in self.grid]
+        for _ in range(level):
+            for i, c in enumerate(coords):
+                if c.size % 2:
+                    c = np.append(c, c[0] + 1.0)
+                coords[i] = (c[0::2] + c[1::2])/2.0
+
+        return coords
+
+    def select_pyramid_level(self, max_points, widths=(1, 1, 1)):
+        """
+        Get the finest pyramid level whose (expanded) grid has no more
+        than `max_points` points, the coarsest level if none fits.
+        """
+        grid = np.array(self.grid)
+        nexpand = np.prod(widths)
+        for level in range(self.max_pyramid_level):
+            if np.prod(grid)*nexpand <= max_points:
+                return level
+            grid = -(-grid // 2)
+
+        return self.max_pyramid_level
+
+    def clear_pyramid(self):
+        "Free cached levels of the downsampling pyramid."
+        self.__pyramid.clear()
+
+    def _build_structured_grid(self, data, grid, widths=(1, 1, 1), coords=None):
         """
-        Build a pyvista.StructuredGrid from 3D data and POSCAR lattice vectors.
+        Build a pyvista grid from 3D data and POSCAR lattice vectors.
 
         This properly handles non-orthogonal (e.g. hexagonal) cells by mapping
         fractional grid coordinates to Cartesian space using the lattice bases.
-        """
-        nx, ny, nz = grid
-        x_frac = np.linspace(0, 1, nx, endpoint=False)
-        y_frac = np.linspace(0, 1, ny, endpoint=False)
-        z_frac = np.linspace(0, 1, nz, endpoint=False)
-        X, Y, Z = np.meshgrid(x_frac, y_frac, z_frac, indexing='ij')
+        An implicit pyvista.ImageData is used for orthogonal cells, no point
+        array is needed, and a pyvista.RectilinearGrid if the points are
+        not evenly spaced. The geometry is cached per (grid, bases, points),
+        only the scalars are replaced in later calls.
 
-        bases = self.bases * self.bases_const
-        cart_X = X * bases[0, 0] + Y * bases[1, 0] + Z * bases[2, 0]
-        cart_Y = X * bases[0, 1] + Y * bases[1, 1] + Z * bases[2, 1]
-        cart_Z = X * bases[0, 2] + Y * bases[1, 2] + Z * bases[2, 2]
+        Parameters:
+        -----------
+        data: 3D array, values on the grid.
+
+        grid: Shape of data (expanded by widths), tuple of int.
+
+        widths: Number of cells covered along x, y, z axis, tuple of int.
 
-        pvgrid = pv.StructuredGrid(cart_X, cart_Y, cart_Z)
-        pvgrid.point_data['values'] = data.flatten(order='F')
+        coords: Fractional coordinates of the points in one cell along x,
+                y, z axis, e.g. from get_pyramid_coords, 3 1D arrays.
+                Default is the grid of data starting at the origin.
+        """
+        grid = tuple(int(n) for n in grid)
+        if coords is None:
+            coords = [np.arange(n//w)/float(n//w) for n, w in zip(grid, widths)]
+        # Fractional coordinates of grid points along each axis.
+        coords = [(np.arange(w)[:, None] + np.asarray(c, dtype=np.float64)).ravel()
+                  for c, w in zip(coords, widths)]
+        bases = self.bases * self.bases_const
+        key = (grid, bases.tobytes(), tuple(c.tobytes() for c in coords))
+
+        if key not in self.__pvgrids:
+            steps = np.array([c[1] - c[0] if c.size > 1 else 1.0 for c in coords])
+            uniform = all(np.allclose(np.diff(c), step)
+                          for c, step in zip(coords, steps))
+            diagonal = np.diag(bases)
+            if np.allclose(bases, np.diag(diagonal)) and (diagonal > 0).all():
+                if uniform:
+                    image_data = getattr(pv, 'ImageData', None) or pv.UniformGrid
+                    origin = [c[0] for c in coords]*diagonal
+                    pvgrid = image_data(dimensions=grid, spacing=steps*diagonal,
+                                        origin=tuple(origin))
+                else:
+                    x, y, z = [c*d for c, d in zip(coords, diagonal)]
+                    pvgrid = pv.RectilinearGrid(x, y, z)
+            else:
+                x, y, z = coords
+                x, y, z = x[:, None, None], y[None, :, None], z[None, None, :]
+                cart_X = x * bases[0, 0] + y * bases[1, 0] + z * bases[2, 0]
+                cart_Y = x * bases[0, 1] + y * bases[1, 1] + z * bases[2, 1]
+                cart_Z = x * bases[0, 2] + y * bases[1, 2] + z * bases[2, 2]
+                pvgrid = pv.StructuredGrid(cart_X, cart_Y, cart_Z)
+
+            # Keep a few geometries only, they are as large as the data.
+            if len(self.__pvgrids) >= 4:
+                self.__pvgrids.pop(next(iter(self.__pvgrids)))
+            self.__pvgrids[key] = pvgrid
+
+        pvgrid = self.__pvgrids[key]
+        pvgrid.point_data['values'] = np.ravel(data, order='F')
         return pvgrid
 
+    def interpolate_slice(self, z, shape=(600, 600), method='fourier'):
+        """
+        Periodic interpolation of a 2D slice cut from volumetric data.
+        Interpolants of the last few slices are reused in later calls.
+
+        Parameters:
+        -----------
+        z: 2D array, values on the slice, covering one period on both axes.
+
+        shape: Number of interpolated points on the two axes, both ends of
+               the period are included, tuple of int.
+
+        method: 'fourier' or 'cubic', see SliceInterpolator, str.
+        """
+        z = np.ascontiguousarray(z)
+        key = (method, z.shape, hashlib.sha1(z.tobytes()).hexdigest())
+        if key not in self.__slice_interps:
+            # Keep a few interpolants only, e.g. when scanning along an axis.
+            if len(self.__slice_interps) >= 4:
+                self.__slice_interps.pop(next(iter(self.__slice_interps)))
+            self.__slice_interps[key] = SliceInterpolator(z, method=method)
+
+        return self.__slice_interps[key](shape)
+
+    def __frac_to_grid(self, frac):
+        """
+        Private helper function to convert fractional coordinates
+        (N x 3) to grid index coordinates (3 x N) of elf_data.
+        """
+        return (np.asarray(frac)*np.array(self.grid)).T
+
+    def get_spline_coeffs(self, name='elf_data'):
+        """
+        Get the cached periodic cubic B-spline coefficients of a data
+        block, they are rebuilt if the data block is replaced.
+        """
+        data = getattr(self, name)
+        if (name not in self.__spline_coeffs or
+                self.__spline_coeffs[name][0] is not data):
+            coeffs = ndimage.spline_filter(data, order=3, mode='grid-wrap',
+                                           output=np.float64)
+            self.__spline_coeffs[name] = data, coeffs
+
+        return self.__spline_coeffs[name][1]
+
+    def probe(self, points, cartesian=False, order=1, name='elf_data',
+              keep_coeffs=True):
+        """
+        Periodic interpolation of data at many points in one call, e.g.
+        along bond paths, at atoms of MD frames or on adsorption sites.
+
+        Parameters:
+        -----------
+        points: Coordinates of points, array of shape (..., 3).
+
+        cartesian: Points are in Cartesian coordinates (Angstrom) instead
+                   of fractional coordinates, bool.
+
+        order: 1 for trilinear, 3 for tricubic spline interpolation, int.
+
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+
+        keep_coeffs: Cache the spline coefficients for later queries
+                     (order 3 only), bool.
+
+        Returns:
+        --------
+        Interpolated values, array of shape points.shape[:-1].
+
+        Example:
+        --------
+        >>> a.probe([[0.0, 0.0, 0.5], [0.25, 0.5, 0.5]])
+        >>> a.probe(frames, cartesian=True, order=3)  # nframe x natom x 3
+        """
+        points = np.asarray(points, dtype=np.float64)
+        shape = points.shape[:-1]
+        frac = points.reshape(-1, 3)
+        if cartesian:
+            frac = np.dot(frac, np.linalg.inv(self.bases*self.bases_const))
+        coords = self.__frac_to_grid(frac)
+
+        if order == 3:
+            if keep_coeffs:
+                coeffs = self.get_spline_coeffs(name)
+            else:
+                coeffs = ndimage.spline_filter(getattr(self, name), order=3,
+                                               mode='grid-wrap', output=np.float64)
+            values = ndimage.map_coordinates(coeffs, coords, order=3,
+                                             mode='grid-wrap', prefilter=False)
+        elif order == 1:
+            values = ndimage.map_coordinates(getattr(self, name), coords, order=1,
+                                             mode='grid-wrap')
+        else:
+            raise ValueError('order must be 1 or 3, got {}'.format(order))
+
+        return values.reshape(shape)
+
+    def slice_plane(self, origin=None, normal=None, atoms=None, size=None,
+                    npoints=(500, 500), order=1):
+        """
+        Sample elf_data on an arbitrary plane in Cartesian space, the
+        lattice (non-orthogonal cell) and periodicity are respected.
+
+        Parameters:
+        -----------
+        origin: Cartesian coordinate of the plane center, 3D vector.
+
+        normal: Normal of the plane, 3D vector.
+
+        atoms: Indices (start from 0) of three atoms in data which define
+               the plane, the center is the center of the three atoms,
+               used instead of origin and normal, tuple of int.
+
+        size: Width and height of the sampled area in Angstrom,
+              the longest cell vector length by default, tuple of float.
+
+        npoints: Number of points on the two in-plane axes, tuple of int.
+
+        order: 1 for trilinear, 3 for cubic spline interpolation, int.
+
+        Returns:
+        --------
+        A PlaneSlice namedtuple, values is the npoints[0] x npoints[1]
+        array of sampled data, points are the Cartesian coordinates of
+        sampled points, npoints[0] x npoints[1] x 3 array.
+
+        Example:
+        --------
+        >>> values, points = a.slice_plane(atoms=(0, 1, 5))
+        >>> values, points = a.slice_plane([0.0, 0.0, 5.0], [0.0, 0.0, 1.0])
+        """
+        bases = self.bases*self.bases_const
+
+        # Two orthonormal in-plane axes u, v.
+        if atoms is not None:
+            positions = np.dot(self.data[list(atoms)], bases)
+            origin = np.mean(positions, axis=0)
+            u = positions[1] - positions[0]
+            normal = np.cross(u, positions[2] - positions[0])
+        elif origin is None or normal is None:
+            raise ValueError('Plane must be given by origin and normal or atoms.')
+        else:
+            origin = np.asarray(origin, dtype=np.float64)
+            normal = np.asarray(normal, dtype=np.float64)
+            # Project a lattice vector which is not parallel to normal.
+            angles = [abs(np.dot(b, normal))/np.linalg.norm(b) for b in bases]
+            b = bases[int(np.argmin(angles))]
+            u = b - np.dot(b, normal)/np.dot(normal, normal)*normal
+
+        norm = np.linalg.norm(normal)
+        if norm < 1e-8:
+            raise ValueError('Illegal plane, normal is a zero vector.')
+        normal = normal/norm
+        u = u/np.linalg.norm(u)
+        v = np.cross(normal, u)
+
+        # Cartesian coordinates of points on the plane.
+        if size is None:
+            length = max(np.linalg.norm(b) for b in bases)
+            size = (length, length)
+        s = np.linspace(-size[0]/2.0, size[0]/2.0, npoints[0])
+        t = np.linspace(-size[1]/2.0, size[1]/2.0, npoints[1])
+        points = (origin + s[:, None, None]*u + t[None, :, None]*v)
+
+        # Interpolate on fractional coordinates.
+        frac = np.dot(points.reshape(-1, 3), np.linalg.inv(bases))
+        values = self.probe(frac, order=order).reshape(npoints)
+
+        return PlaneSlice(values, points)
+
     # 装饰器
     def contour_decorator(func):
         '''
@@ -372,7 +1653,8 @@ class ElfCar(PosCar):
         Set ndim on x, y axis and z values.
         '''
         def contour_wrapper(self, axis_cut='z', distance=0.5,
-                            show_mode='show', widths=(1, 1, 1)):
+                            show_mode='show', widths=(1, 1, 1),
+                            interp='fourier'):
             '''
             绘制ELF等值线图
             Parameter in kwargs
@@ -385,10 +1667,12 @@ class ElfCar(PosCar):
                 'save' or 'show'
             widths: tuple of int,
                 number of replication on x, y, z axis
+            interp: str
+                'fourier' or 'cubic', periodic interpolation method
             '''
-            #expand elf_data and grid
-            elf_data, grid = self.expand_data(self.elf_data, self.grid,
-                                              widths=widths)
+            #expand elf_data and grid virtually, only the cut is created
+            elf_data = PeriodicView(self.elf_data, widths)
+            grid = elf_data.shape
             self.__logger.info('data shape = %s', str(elf_data.shape))
             # now cut the cube
             if abs(distance) > 1:
@@ -406,16 +1690,18 @@ class ElfCar(PosCar):
                 z = elf_data[:, :, nlayer]
                 ndim0, ndim1 = grid[1], grid[0]  # x, y
 
-            return func(self, ndim0, ndim1, z, show_mode=show_mode)
+            return func(self, ndim0, ndim1, z, show_mode=show_mode,
+                        interp=interp)
 
         return contour_wrapper
 
     @contour_decorator
-    def plot_contour(self, ndim0, ndim1, z, show_mode):
+    def plot_contour(self, ndim0, ndim1, z, show_mode, interp):
         '''
         ndim0: int, point number on x-axis
         ndim1: int, point number on y-axis
         z    : 2darray, values on plane perpendicular to z axis
+        interp: str, periodic interpolation method
         '''
         #do 2d interpolation
         #get slice object
@@ -424,15 +1710,14 @@ class ElfCar(PosCar):
         self.__logger.info('z shape = %s, x shape = %s, y shape = %s',
                            str(z.shape), str(x.shape), str(y.shape))
         mx, my = np.mgrid[s]
-        #use cubic 2d interpolation
-        interpfunc = interp2d(x, y, z, kind='cubic')
+        #use periodic 2d interpolation
         newx = np.linspace(0, ndim0, 600)
         newy = np.linspace(0, ndim1, 600)
         #-----------for plot3d---------------------
         ms = np.s_[0:ndim0:600j, 0:ndim1:600j]  # |
         newmx, newmy = np.mgrid[ms]             # |
         #-----------for plot3d---------------------
-        newz = interpfunc(newx, newy)
+        newz = self.interpolate_slice(z, (600, 600), method=interp)
 
         #plot 2d contour map
         fig2d_1, fig2d_2, fig2d_3 = plt.figure(), plt.figure(), plt.figure()
@@ -468,15 +1753,12 @@ class ElfCar(PosCar):
         return
 
     @contour_decorator
-    def plot_mcontour(self, ndim0, ndim1, z, show_mode):
+    def plot_mcontour(self, ndim0, ndim1, z, show_mode, interp):
         "Plot surface contour using PyVista (preferred) or mayavi (legacy)."
-        #do 2d interpolation
-        s = np.s_[0:ndim0:1, 0:ndim1:1]
-        x, y = np.ogrid[s]
-        interpfunc = interp2d(x, y, z, kind='cubic')
+        #do periodic 2d interpolation
         newx = np.linspace(0, ndim0, 600)
         newy = np.linspace(0, ndim1, 600)
-        newz = interpfunc(newx, newy)
+        newz = self.interpolate_slice(z, (600, 600), method=interp)
 
         if pyvista_installed:
             nx, ny = len(newx), len(newy)
@@ -515,6 +1797,21 @@ class ElfCar(PosCar):
 
         return
 
+    def __get_plot_data(self, widths, **kwargs):
+        """
+        Private helper function to get the pyramid level of elf_data
+        fitting the point budget of a 3D plot, and fractional coordinates
+        of its points.
+        """
+        if kwargs.get('final', False):
+            level = 0
+        else:
+            max_points = kwargs.get('max_points', 1 << 21)
+            level = self.select_pyramid_level(max_points, widths)
+        self.__logger.debug('plot pyramid level %d', level)
+
+        return self.get_pyramid_level(level), self.get_pyramid_coords(level)
+
     def plot_contour3d(self, **kwargs):
         '''
         Plot 3d isosurface contour using PyVista (preferred) or mayavi (legacy).
@@ -527,11 +1824,16 @@ class ElfCar(PosCar):
             'opacity' : float, opacity of contour,
             'widths'   : tuple of int
                         number of replication on x, y, z axis,
+            'max_points': int, point budget of the plotted grid, a
+                          downsampled pyramid level is used to keep
+                          interaction responsive, default is 2**21,
+            'final'   : bool, render the full resolution grid,
         }
         '''
         # set parameters
         widths = kwargs['widths'] if 'widths' in kwargs else (1, 1, 1)
-        elf_data, grid = self.expand_data(self.elf_data, self.grid, widths)
+        elf_data, coords = self.__get_plot_data(widths, **kwargs)
+        elf_data, grid = self.expand_data(elf_data, elf_data.shape, widths)
         maxdata = np.max(elf_data)
         maxct = kwargs['maxct'] if 'maxct' in kwargs else maxdata
         if maxct > maxdata:
@@ -540,7 +1842,7 @@ class ElfCar(PosCar):
         nct = kwargs['nct'] if 'nct' in kwargs else 5
 
         if pyvista_installed:
-            pvgrid = self._build_structured_grid(elf_data, grid)
+            pvgrid = self._build_structured_grid(elf_data, grid, widths, coords)
             contours = pvgrid.contour(nct, scalars='values',
                                       rng=(0, maxct) if maxct < maxdata else None)
             pl = pv.Plotter()
@@ -565,16 +1867,21 @@ class ElfCar(PosCar):
         return
 
     def plot_field(self, **kwargs):
-        "Plot scalar field volume using PyVista (preferred) or mayavi (legacy)."
+        '''
+        Plot scalar field volume using PyVista (preferred) or mayavi (legacy).
+        A downsampled pyramid level is plotted unless final=True,
+        see plot_contour3d for 'max_points' and 'final'.
+        '''
         vmin = kwargs['vmin'] if 'vmin' in kwargs else 0.0
         vmax = kwargs['vmax'] if 'vmax' in kwargs else 1.0
         axis_cut = kwargs.get('axis_cut', 'z')
         nct = kwargs['nct'] if 'nct' in kwargs else 5
         widths = kwargs['widths'] if 'widths' in kwargs else (1, 1, 1)
-        elf_data, grid = self.expand_data(self.elf_data, self.grid, widths)
+        elf_data, coords = self.__get_plot_data(widths, **kwargs)
+        elf_data, grid = self.expand_data(elf_data, elf_data.shape, widths)
 
         if pyvista_installed:
-            pvgrid = self._build_structured_grid(elf_data, grid)
+            pvgrid = self._build_structured_grid(elf_data, grid, widths, coords)
             normals = {'x': (1, 0, 0), 'y': (0, 1, 0), 'z': (0, 0, 1)}
             normal = normals.get(axis_cut.lower(), (0, 0, 1))
             center = pvgrid.center
@@ -606,13 +1913,425 @@ class ElfCar(PosCar):
 
 
 class ChgCar(ElfCar):
-    def __init__(self, filename='CHGCAR'):
+
+    # Names of data blocks in file.
+    blocks = ('elf_data', 'mag_data')
+
+    def __init__(self, filename='CHGCAR', lazy=False, cache=False, nprocs=1,
+                 dtype=np.float64):
         '''
         Create a CHGCAR file class.
 
         Example:
 
         >>> a = ChgCar()
+        >>> b = ChgCar('CHGCAR', lazy=True)
+        >>> c = ChgCar('CHGCAR', cache=True)
+        >>> d = ChgCar('CHGCAR', nprocs=8)
+        >>> e = ChgCar('CHGCAR', dtype=np.float32)
+        '''
+        self.__spectra = {}  # Fourier transforms and derived fields
+
+        ElfCar.__init__(self, filename, lazy=lazy, cache=cache, nprocs=nprocs,
+                        dtype=dtype)
+
+    @LazyProperty
+    def mag_data(self):
+        """
+        Magnetization density (up - down) of a spin-polarized CHGCAR,
+        only loaded when first accessed. elf_data is the total density.
+        """
+        if len(self.block_offsets) < 2:
+            msg = "'{}' has no magnetization data".format(self.filename)
+            raise AttributeError(msg)
+
+        return self.load_block('mag_data', self.block_offsets[1])
+
+    @LazyProperty
+    def aug_occupancies(self):
+        """
+        Augmentation occupancies of the total density, list of 1D array
+        for each atom, only parsed when first accessed.
+        """
+        return self.load_aug_occupancies(0)
+
+    def load_aug_occupancies(self, iblock=0):
+        """
+        Parse augmentation occupancies following a data block.
+
+        Parameters:
+        -----------
+        iblock: Index of the data block, 0 for total density and
+                1 for magnetization density, int.
+
+        Returns:
+        --------
+        List of 1D array, augmentation occupancies of each atom.
+        """
+        occupancies = []
+        with open(self.filename, 'rb') as f:
+            for _, nvalue, offset in self.aug_offsets[iblock]:
+                f.seek(offset)
+                occupancies.append(file2array(f, nvalue))
+
+        return occupancies
+
+    def integrate_spheres(self, radii, name='elf_data'):
+        """
+        Integrate charge (or magnetization) in spheres around atoms.
+
+        Parameters:
+        -----------
+        radii: Radii of spheres in Angstrom, a float for all atoms,
+               a dict for atom types, e.g. {'Pt': 1.3, 'O': 0.8},
+               or a sequence for each atom.
+
+        name: 'elf_data' for charge or 'mag_data' for magnetization, str.
+
+        Returns:
+        --------
+        1D array, integrated charge of each atom.
+
+        Example:
+        --------
+        >>> a.integrate_spheres({'Li': 1.0, 'H': 0.6})
+        """
+        if isinstance(radii, dict):
+            radii = sum([[radii[t]]*n for t, n in
+                         zip(self.atom_types, self.atom_numbers)], [])
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), (self.natom, ))
+
+        data = getattr(self, name)
+        grid = np.array(self.grid)
+        bases = self.bases*self.bases_const
+        # Number of grid points per Angstrom normal to lattice planes.
+        density = np.linalg.norm(np.linalg.inv(bases), axis=0)*grid
+
+        charges = np.zeros(self.natom)
+        for i, (frac, radius) in enumerate(zip(self.data % 1.0, radii)):
+            # Grid points in the box around the sphere.
+            center = frac*grid
+            lo = np.floor(center - radius*density).astype(int)
+            npoint = np.minimum(np.ceil(2*radius*density).astype(int) + 2, grid)
+            ix, iy, iz = [np.arange(l, l + n) for l, n in zip(lo, npoint)]
+
+            # Minimum image displacements in fractional coordinates.
+            d = [idx/n - f for idx, n, f in zip((ix, iy, iz), grid, frac)]
+            d = [di - np.round(di) for di in d]
+            cart = (d[0][:, None, None, None]*bases[0] +
+                    d[1][None, :, None, None]*bases[1] +
+                    d[2][None, None, :, None]*bases[2])
+            inside = np.einsum('ijkl,ijkl->ijk', cart, cart) <= radius**2
+
+            values = data[np.ix_(ix % grid[0], iy % grid[1], iz % grid[2])]
+            charges[i] = np.sum(values[inside], dtype=np.float64)
+
+        return charges/np.prod(grid)
+
+    def integrate_voronoi(self, name='elf_data', nlayer=16):
+        """
+        Integrate charge (or magnetization) in periodic Voronoi cells of
+        atoms, each grid point is assigned to the nearest atom under
+        minimum image convention. Data is streamed in chunks when it
+        is not loaded.
+
+        Parameters:
+        -----------
+        name: 'elf_data' for charge or 'mag_data' for magnetization, str.
+
+        nlayer: Number of z layers in each chunk, int.
+
+        Returns:
+        --------
+        1D array, integrated charge of each atom.
+        """
+        nx, ny, nz = self.grid
+        bases = self.bases*self.bases_const
+
+        # Atoms and their images in neighbor cells.
+        shifts = np.array([[i, j, k] for i in (-1, 0, 1)
+                           for j in (-1, 0, 1) for k in (-1, 0, 1)])
+        images = (self.data % 1.0)[None, :, :] + shifts[:, None, :]
+        tree = cKDTree(np.dot(images.reshape(-1, 3), bases))
+
+        # Cartesian coordinates of grid points in a z layer.
+        fx, fy = np.meshgrid(np.arange(nx)/nx, np.arange(ny)/ny, indexing='ij')
+        layer = np.outer(fx.ravel(order='F'), bases[0]) + np.outer(fy.ravel(order='F'), bases[1])
+
+        charges = np.zeros(self.natom)
+        for start, chunk in self.iter_chunks(name, nlayer):
+            nlayer = chunk.shape[2]
+            heights = np.arange(start, start + nlayer)/nz
+            points = layer[None, :, :] + heights[:, None, None]*bases[2]
+            _, idx = tree.query(points.reshape(-1, 3), workers=-1)
+            charges += np.bincount(idx % self.natom,
+                                   weights=chunk.ravel(order='F'),
+                                   minlength=self.natom)
+
+        return charges/(nx*ny*nz)
+
+    @LazyProperty
+    def reciprocal_bases(self):
+        """
+        Reciprocal lattice vectors (with the 2*pi factor) in 1/Angstrom,
+        one vector in a row.
+        """
+        return 2*np.pi*np.linalg.inv(self.bases*self.bases_const).T
+
+    def __get_spectrum(self, name):
+        """
+        Private helper function to get the cached Fourier transform of
+        the density (data divided by cell volume) of a data block,
+        rebuilt if the data block is replaced.
+        """
+        data = getattr(self, name)
+        cached = self.__spectra.get(name)
+        if cached is None or cached['data'] is not data:
+            volume = abs(np.linalg.det(self.bases*self.bases_const))
+            density = np.asarray(data, dtype=np.float64)/volume
+            spectrum = scipy_fft.rfftn(density, workers=-1)
+            self.__spectra[name] = {'data': data, 'spectrum': spectrum}
+
+        return self.__spectra[name]
+
+    def __get_wave_vector(self, axis, derivative=True):
+        """
+        Private helper function to get a Cartesian component of wave
+        vectors on the rfftn frequency grid. For first derivatives the
+        Nyquist frequencies of even grids are dropped to keep the
+        result real.
+        """
+        freqs = []
+        for i, n in enumerate(self.grid):
+            if i < 2:
+                m = scipy_fft.fftfreq(n, 1.0/n)
+            else:
+                m = scipy_fft.rfftfreq(n, 1.0/n)
+            if derivative and n % 2 == 0:
+                m[np.abs(m) == n//2] = 0.0
+            shape = [1, 1, 1]
+            shape[i] = -1
+            freqs.append(m.reshape(shape))
+        b = self.reciprocal_bases[:, axis]
+
+        return freqs[0]*b[0] + freqs[1]*b[1] + freqs[2]*b[2]
+
+    def clear_derivatives(self):
+        """
+        Free the cached Fourier transforms and gradients, they must be
+        cleared after the data are modified in place (replaced data
+        blocks are found automatically).
+        """
+        self.__spectra.clear()
+
+    def get_gradient(self, name='elf_data'):
+        """
+        Get gradient of the density (data divided by cell volume, e/A^3)
+        with spectral derivatives on the (skewed) periodic cell.
+
+        The Fourier transform and the gradient are cached and shared by
+        get_gradient_norm and get_reduced_gradient.
+
+        Parameters:
+        -----------
+        name: Name of the data block, 'elf_data' or 'mag_data', str.
+
+        Returns:
+        --------
+        4D array, Cartesian components of gradient, 3 x NGX x NGY x NGZ.
+        """
+        cache = self.__get_spectrum(name)
+        if 'gradient' not in cache:
+            spectrum = cache['spectrum']
+            gradient = np.empty((3, ) + self.grid)
+            for axis in range(3):
+                k = self.__get_wave_vector(axis)
+                gradient[axis] = scipy_fft.irfftn(1j*k*spectrum, s=self.grid,
+                                                  workers=-1)
+            cache['gradient'] = gradient
+
+        return cache['gradient']
+
+    def get_gradient_norm(self, name='elf_data'):
+        """
+        Get magnitude of the density gradient, see get_gradient.
+        """
+        gradient = self.get_gradient(name)
+        return np.sqrt(np.einsum('i...,i...->...', gradient, gradient))
+
+    def get_laplacian(self, name='elf_data'):
+        """
+        Get Laplacian of the density (data divided by cell volume) with
+        spectral derivatives, see get_gradient.
+        """
+        spectrum = self.__get_spectrum(name)['spectrum']
+        k2 = sum(self.__get_wave_vector(axis, derivative=False)**2
+                 for axis in range(3))
+
+        return scipy_fft.irfftn(-k2*spectrum, s=self.grid, workers=-1)
+
+    def get_reduced_gradient(self, name='elf_data', rho_min=1e-8):
+        """
+        Get reduced density gradient (RDG) for non-covalent interaction
+        analysis, s = |grad(rho)| / (2 (3 pi^2)^(1/3) rho^(4/3)).
+
+        Parameters:
+        -----------
+        name: Name of the data block, str.
+
+        rho_min: Lower bound of density in e/A^3 to avoid division
+                 by zero in vacuum, float.
+        """
+        volume = abs(np.linalg.det(self.bases*self.bases_const))
+        rho = np.maximum(np.asarray(getattr(self, name))/volume, rho_min)
+        coeff = 2*(3*np.pi**2)**(1.0/3)
+
+        return self.get_gradient_norm(name)/(coeff*rho**(4.0/3))
+
+
+class LocPot(ElfCar):
+    def __init__(self, filename='LOCPOT', lazy=False, cache=False, nprocs=1,
+                 dtype=np.float64):
         '''
-        ElfCar.__init__(self, filename)
+        Create a LOCPOT file class, elf_data is the local potential (eV).
 
+        Example:
+
+        >>> a = LocPot()
+        >>> b = LocPot('LOCPOT', lazy=True)
+        >>> b.get_work_function(OutCar('OUTCAR'))
+        '''
+        ElfCar.__init__(self, filename, lazy=lazy, cache=cache, nprocs=nprocs,
+                        dtype=dtype)
+
+    def get_vacuum_level(self, axis='z', tol=0.01, min_width=1.0):
+        """
+        Get vacuum level from the plateau of planar averaged potential.
+
+        Flat regions are those where the gradient of planar averaged
+        potential is smaller than `tol`, the vacuum is the flat region
+        wider than `min_width` with the highest potential.
+
+        Parameters:
+        -----------
+        axis: 'x', 'y' or 'z', the surface normal axis, str.
+
+        tol: Gradient tolerance of flat region in eV/Angstrom, float.
+
+        min_width: Minimum width of vacuum plateau in Angstrom, float.
+
+        Returns:
+        --------
+        Vacuum level (eV) and (start, end) positions of the plateau,
+        end is smaller than start if the plateau crosses the cell boundary.
+        """
+        positions, values = self.planar_average(axis)
+        n = len(values)
+        step = positions[1] - positions[0]
+
+        # Periodic central difference.
+        gradient = (np.roll(values, -1) - np.roll(values, 1))/(2*step)
+        flat = np.abs(gradient) < tol
+
+        if flat.all():
+            starts, ends, shift = np.array([0]), np.array([n]), 0
+        else:
+            # Roll the profile to begin at a non-flat point.
+            shift = int(np.argmin(flat))
+            flat = np.roll(flat, -shift)
+            edges = np.diff(np.concatenate([[0], flat.astype(int), [0]]))
+            starts = np.nonzero(edges == 1)[0]
+            ends = np.nonzero(edges == -1)[0]
+
+        # Mean potential of all flat regions.
+        csum = np.concatenate([[0.0], np.cumsum(np.roll(values, -shift))])
+        levels = (csum[ends] - csum[starts])/(ends - starts)
+        wide = (ends - starts)*step >= min_width
+        if not wide.any():
+            msg = "No vacuum plateau wider than {} Angstrom in {}."
+            raise ValueError(msg.format(min_width, self.filename))
+
+        idx = np.nonzero(wide)[0][np.argmax(levels[wide])]
+        start = positions[(starts[idx] + shift) % n]
+        end = positions[(ends[idx] - 1 + shift) % n]
+        self.vacuum_level = levels[idx]
+
+        return self.vacuum_level, (start, end)
+
+    def get_work_function(self, efermi, **kwargs):
+        """
+        Get work function, the difference between vacuum level and
+        Fermi level.
+
+        Parameters:
+        -----------
+        efermi: Fermi level in eV, float or OutCar object.
+
+        kwargs: Keyword arguments for get_vacuum_level.
+
+        Example:
+        --------
+        >>> a.get_work_function(1.3481)
+        >>> a.get_work_function(OutCar('OUTCAR'), axis='z')
+        """
+        efermi = getattr(efermi, 'efermi', efermi)
+        vacuum_level, _ = self.get_vacuum_level(**kwargs)
+        self.work_function = vacuum_level - efermi
+
+        return self.work_function
+
+
+def chgcar_diff(ab, a, b, filename='CHGDIFF', nlayer=16):
+    """
+    Get charge density difference AB - A - B, the three CHGCARs are
+    streamed in lockstep chunk by chunk, peak memory is bounded by the
+    chunk size instead of the grid size.
+
+    Parameters:
+    -----------
+    ab, a, b: File names of the CHGCARs or ChgCar objects.
+
+    filename: Name of the output file, a CHGCAR-like text file with the
+              header of AB, or a binary .npy file if it ends with '.npy', str.
+
+    nlayer: Number of z layers in each chunk, int.
+
+    Example:
+    --------
+    >>> chgcar_diff('AB/CHGCAR', 'A/CHGCAR', 'B/CHGCAR', 'CHGDIFF')
+    >>> chgcar_diff('AB/CHGCAR', 'A/CHGCAR', 'B/CHGCAR', 'chgdiff.npy')
+    """
+    chgcars = [ChgCar(i, lazy=True) if isinstance(i, str) else i
+               for i in (ab, a, b)]
+
+    # Check grids and lattices.
+    ab = chgcars[0]
+    for chgcar in chgcars[1:]:
+        if chgcar.grid != ab.grid:
+            msg = "Grid of {}({}) and {}({}) are different."
+            msg = msg.format(chgcar.filename, chgcar.grid, ab.filename, ab.grid)
+            raise UnmatchedDataShape(msg)
+        if not np.allclose(chgcar.bases*chgcar.bases_const, ab.bases*ab.bases_const):
+            msg = "Lattice of {} and {} are different."
+            raise ValueError(msg.format(chgcar.filename, ab.filename))
+
+    chunks = zip(*[chgcar.iter_chunks(nlayer=nlayer) for chgcar in chgcars])
+
+    if filename.endswith('.npy'):
+        diff = np.lib.format.open_memmap(filename, mode='w+', shape=ab.grid,
+                                         fortran_order=True)
+        for (start, ab_chunk), (_, a_chunk), (_, b_chunk) in chunks:
+            end = start + ab_chunk.shape[2]
+            diff[:, :, start: end] = np.subtract(ab_chunk, a_chunk, dtype=np.float64) - b_chunk
+        diff.flush()
+        del diff
+    else:
+        with open(filename, 'wb') as f:
+            f.write(ab.get_header_content().encode())
+            writer = GridWriter(f)
+            for (_, ab_chunk), (_, a_chunk), (_, b_chunk) in chunks:
+                diff_chunk = np.subtract(ab_chunk, a_chunk, dtype=np.float64) - b_chunk
+                writer.write(diff_chunk.ravel(order='F'))
+            writer.close()
+
+    return filename
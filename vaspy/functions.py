@@ -4,6 +4,8 @@ import string
 
 import numpy as np
 
+from .errors import UnmatchedDataShape
+
 
 def str2list(rawstr):
     rawlist = rawstr.strip(string.whitespace).split(' ')
@@ -22,6 +24,139 @@ def line2list(line, field=' ', dtype=float):
     return datalist
 
 
+def file2array(f, count, dtype=np.float64):
+    """
+    Read `count` whitespace separated numbers from the current position
+    of a binary file object into a new 1D array.
+
+    The numbers are parsed by numpy directly into a preallocated array,
+    no intermediate Python objects are created. The file is left
+    positioned right after the last number read.
+    """
+    data = np.fromfile(f, dtype=dtype, count=count, sep=' ')
+    if data.size != count:
+        msg = "Expect {} values in {}, but only {} read."
+        msg = msg.format(count, getattr(f, 'name', f), data.size)
+        raise UnmatchedDataShape(msg)
+
+    return data
+
+
+def skip_lines(f, nlines, chunk_size=1 << 20):
+    """
+    Move a binary file object forward past the next `nlines` lines
+    without decoding them. The last line in file may have no newline.
+    """
+    last = b''
+    while nlines > 0:
+        start = f.tell()
+        chunk = f.read(chunk_size)
+        if not chunk:
+            if nlines == 1 and last not in (b'', b'\n'):
+                return
+            raise EOFError("Unexpected end of file {}.".format(getattr(f, 'name', f)))
+        last = chunk[-1:]
+        n = chunk.count(b'\n')
+        if n < nlines:
+            nlines -= n
+        else:
+            idx = -1
+            for i in range(nlines):
+                idx = chunk.index(b'\n', idx + 1)
+            f.seek(start + idx + 1)
+            nlines = 0
+
+
+def count_newlines(filename, start, end, chunk_size=1 << 24):
+    "Count newlines in the byte range [start, end) of a file."
+    count = 0
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(remaining, chunk_size))
+            if not chunk:
+                break
+            count += chunk.count(b'\n')
+            remaining -= len(chunk)
+
+    return count
+
+
+def fill_from_file(filename, start, count, shared_name, offset, size,
+                   dtype=np.float64):
+    """
+    Parse `count` numbers from byte `start` of a file and store them
+    in a file-backed 1D array of `size` elements from element `offset`.
+    Used by worker processes to fill a shared array in place.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = file2array(f, count, dtype=dtype)
+    shared = np.memmap(shared_name, dtype=dtype, mode='r+', shape=(size, ))
+    shared[offset: offset+count] = data
+    shared.flush()
+    del shared
+
+
+def pad_spectrum(X, num, axis=0):
+    """
+    Zero-pad (or truncate) the Fourier coefficients X from numpy.fft.fft
+    to `num` frequencies along an axis, the Nyquist component of an even
+    length is split evenly. The inverse transform of the result, times
+    num/n, is the Fourier interpolation of the original data.
+    """
+    n = X.shape[axis]
+    if num == n:
+        return X
+
+    shape = list(X.shape)
+    shape[axis] = num
+    Y = np.zeros(shape, dtype=X.dtype)
+
+    sl = [slice(None)]*X.ndim
+    N = min(num, n)
+    nyq = N//2 + 1
+    # Non-negative frequencies.
+    sl[axis] = slice(0, nyq)
+    Y[tuple(sl)] = X[tuple(sl)]
+    # Negative frequencies.
+    if N > 2:
+        sl[axis] = slice(nyq - N, None)
+        Y[tuple(sl)] = X[tuple(sl)]
+
+    # Nyquist component.
+    if N % 2 == 0:
+        if num < n:
+            sl[axis] = slice(num - N//2, num - N//2 + 1)
+            xsl = list(sl)
+            xsl[axis] = slice(N//2, N//2 + 1)
+            Y[tuple(sl)] += X[tuple(xsl)]
+        else:
+            sl[axis] = slice(N//2, N//2 + 1)
+            Y[tuple(sl)] *= 0.5
+            nyq_coeff = Y[tuple(sl)]
+            sl[axis] = slice(num - N//2, num - N//2 + 1)
+            Y[tuple(sl)] = nyq_coeff
+
+    return Y
+
+
+def window_weights(width):
+    """
+    Weights of a centered sliding window covering `width` grid steps, an
+    odd number of points with full weight and fractional weights at both
+    ends, normalized to 1. Applied with a convolution, the average covers
+    exactly `width` steps and is not shifted for any width.
+    """
+    nfull = max(int(np.floor((width - 1.0)/2.0)), 0)
+    fraction = max((width - 2*nfull - 1.0)/2.0, 0.0)
+    weights = np.ones(2*nfull + 3)
+    weights[[0, -1]] = fraction
+
+    return weights/np.sum(weights)
+
+
 def array2str(raw_array):
     """
     convert 2d array -> string
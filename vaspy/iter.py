@@ -8,6 +8,10 @@ Updated by PytLab <shaozhengjiang@gmail.com>, March 2017
 ========================================================================
 
 """
+import hashlib
+import json
+import logging
+import os
 import re
 from collections import namedtuple
 from string import whitespace
@@ -23,7 +27,7 @@ except ImportError:
 from vaspy import VasPy, PY2
 from vaspy import LazyProperty
 from vaspy.atomco import PosCar, XyzFile
-from vaspy.functions import line2list
+from vaspy.functions import line2list, file2array
 # Copy a XdatCar from atomco.
 from vaspy.atomco import XdatCar
 
@@ -179,7 +183,20 @@ class OutCar(VasPy):
                  "cm-1", "meV", "coordinates", "deltas")
     title_regex = re.compile(r"\s*X\s*Y\s*Z\s*dx\s*dy\s*dz\s*")
 
-    def __init__(self, filename="OUTCAR", poscar="POSCAR"):
+    # 抽取费米能级的正则表达式
+    # Regular expression for Fermi level.
+    efermi_regex = re.compile(r"^\s*E-fermi\s*:\s*([\+\-]?\d+\.\d+)")
+
+    # 每个离子步中各数据段的标记, 用于建立字节偏移索引
+    # Markers of per ionic step sections, for the byte offset index.
+    section_markers = {"forces": b"TOTAL-FORCE (eV/Angst)",
+                       "energy": b"FREE ENERGIE OF THE ION-ELECTRON SYSTEM",
+                       "efermi": b"E-fermi :"}
+
+    # Format version of the saved index, bumped when its layout changes.
+    index_version = 1
+
+    def __init__(self, filename="OUTCAR", poscar="POSCAR", cache_index=False):
         """
         Create a OUTCAR file class.
 
@@ -188,17 +205,35 @@ class OutCar(VasPy):
         filename: File name of OUTCAR, default name is "OUTCAR"(OUTCAR in current path).
 
         poscar: File name of POSCAR, default value is "POSCAR"(POSCAR in current path).
+                It is only loaded when the T/F info is needed, all
+                coordinates are movable if it does not exist or is None.
+
+        cache_index: Save the byte offset index of ionic steps to a JSON
+                     file next to OUTCAR and reuse it if OUTCAR is not
+                     changed, bool.
 
         Example:
 
         >>> a = OutCar(filename='OUTCAR', poscar="POSCAR")
+        >>> b = OutCar(filename='OUTCAR', cache_index=True)
 
         Class attributes descriptions
         =================================================================
           Attribute           Description
           ===============    ============================================
           filename            string, name of OUTCAR file
-          max_forces          list of float, 每个离子步迭代的最大原子受力
+          poscar              PosCar, 仅在需要T/F信息时加载
+          atom_types          list of str, 原子类型
+          atom_numbers        list of int, 各类型原子数
+          index               dict of list, 各数据段的字节偏移
+          nsteps              int, 离子步数
+          restarted           bool, 上次refresh时OUTCAR是否被重写
+          natom               int, 原子数
+          force_blocks        np.array, 所有离子步的坐标和受力
+          energies            np.array, 每个离子步的能量(TOTEN)
+          max_forces          np.array, 每个离子步迭代的最大原子受力
+          max_atoms           np.array, 每个离子步受力最大原子序号
+          rms_forces          np.array, 每个离子步的均方根受力
           last_max_force      float, 最后一步的最大原子受力
           last_max_atom       int, 最后一步受力最大原子序号
           zpe                 float, 零点能
@@ -207,30 +242,441 @@ class OutCar(VasPy):
         """
         VasPy.__init__(self, filename)
 
-        # Get PosCar object.
-        self.poscar = PosCar(poscar)
+        self.cache_index = cache_index
+        self.poscar_name = poscar
+        self.__poscar_warned = False
+        self.restarted = False
+        self.__buffers = {}  # growable buffers of refreshed arrays
 
-        # Check parameter validity.
-        self.__check()
+        # Set logger.
+        self.__logger = logging.getLogger("vaspy.OutCar")
 
-    def __check(self):
+    @LazyProperty
+    def poscar(self):
         """
-        Private helper function to check consistency of POSCAR and OUTCAR.
+        POSCAR对象, 仅在首次访问时加载.
+        PosCar object of the POSCAR, loaded on first access.
         """
-        # Coordinates in OUTCAR.
-        _, coords, _ = next(self.iforces)
-        coords_outcar = np.array(coords)
-        shape_outcar = coords_outcar.shape
+        if self.poscar_name is None or not os.path.exists(self.poscar_name):
+            msg = "'{}' has no POSCAR '{}'".format(self.__class__.__name__,
+                                                  self.poscar_name)
+            raise AttributeError(msg)
 
-        # Coordinates in POSCAR
-        coords_poscar = self.poscar.data
-        shape_poscar = coords_poscar.shape
+        poscar = PosCar(self.poscar_name)
 
+        # Check consistency of POSCAR and OUTCAR.
+        shape_outcar = (self.natom, 3)
+        shape_poscar = poscar.data.shape
         if shape_poscar != shape_outcar:
             msg = "Shape of data in POSCAR({}) and OUTCAR({}) are different."
             msg = msg.format(shape_poscar, shape_outcar)
             raise ValueError(msg)
 
+        return poscar
+
+    def __parse_header(self):
+        """
+        Private helper function to get atom types (from POTCAR lines) and
+        atom numbers (ions per type) in the header of OUTCAR.
+        """
+        potcars = []
+        with open(self.filename, "rb") as f:
+            for line in f:
+                if line.startswith(b" POTCAR:"):
+                    # POTCAR:   PAW_PBE Pt_pv 05Jan2001
+                    potcars.append(line.split()[2].split(b"_")[0].decode())
+                elif b"ions per type" in line:
+                    atom_numbers = [int(i) for i in line.split(b"=")[1].split()]
+                    break
+            else:
+                msg = "No ions per type in '{}'".format(self.filename)
+                raise AttributeError(msg)
+
+        self.atom_numbers = atom_numbers
+        self.atom_types = potcars[: len(atom_numbers)]
+
+    @LazyProperty
+    def atom_types(self):
+        """
+        原子类型列表.
+        Atom types from POTCAR lines in OUTCAR, list of str.
+        """
+        self.__parse_header()
+        return self.atom_types
+
+    @LazyProperty
+    def atom_numbers(self):
+        """
+        各类型原子数.
+        Numbers of ions per type in OUTCAR, list of int.
+        """
+        self.__parse_header()
+        return self.atom_numbers
+
+    @LazyProperty
+    def index(self):
+        """
+        每个离子步各数据段所在行的字节偏移索引。
+        Byte offsets of lines starting per ionic step sections, a dict of
+        list for sections in section_markers, built in one pass.
+        """
+        saved = self.__load_index() if self.cache_index else None
+        if saved is None:
+            index = {name: [] for name in self.section_markers}
+            self.__indexed_end = self.__scan_sections(0, index)
+            self.__drop_incomplete(index)
+            if self.cache_index:
+                self.__dump_index(index)
+        else:
+            index, self.__indexed_end = saved
+        self.__fingerprint = self.__get_fingerprint()
+
+        return index
+
+    def __get_fingerprint(self, length=None):
+        """
+        Private helper function to get inode, length and SHA1 hash of the
+        leading bytes (the header with run date) of indexed part of OUTCAR,
+        used to find a rewritten OUTCAR of a restarted job.
+        """
+        if length is None:
+            length = min(self.__indexed_end, 4096)
+        with open(self.filename, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            head = f.read(length)
+
+        return inode, length, hashlib.sha1(head).hexdigest()
+
+    def __is_rewritten(self):
+        """
+        Private helper function to check if OUTCAR is truncated or
+        rewritten since it was indexed, e.g. the job is restarted.
+        """
+        if os.path.getsize(self.filename) < self.__indexed_end:
+            return True
+
+        _, length, _ = self.__fingerprint
+        if self.__get_fingerprint(length) != self.__fingerprint:
+            return True
+
+        # The last indexed force block must still be in place.
+        offsets = self.index["forces"]
+        if offsets:
+            with open(self.filename, "rb") as f:
+                f.seek(offsets[-1])
+                if not self.__is_force_header(f.readline()):
+                    return True
+
+        return False
+
+    def __drop_incomplete(self, index):
+        """
+        Private helper function to remove sections at the end of file
+        which are not completely written yet (e.g. by a running job), they
+        are indexed again in the next refresh.
+        """
+        nlines = {"forces": self.natom + 3, "energy": 3, "efermi": 1}
+        rollback = self.__indexed_end
+
+        with open(self.filename, "rb") as f:
+            for name, offsets in index.items():
+                if not offsets:
+                    continue
+                # Count complete lines of the last section.
+                f.seek(offsets[-1])
+                remaining = self.__indexed_end - offsets[-1]
+                n = nlines.get(name, 1)
+                while n > 0 and remaining > 0:
+                    chunk = f.read(min(remaining, 1 << 16))
+                    remaining -= len(chunk)
+                    n -= chunk.count(b"\n")
+                if n > 0:
+                    rollback = min(rollback, offsets[-1])
+
+        if rollback < self.__indexed_end:
+            for offsets in index.values():
+                while offsets and offsets[-1] >= rollback:
+                    offsets.pop()
+            self.__indexed_end = rollback
+
+    def refresh(self):
+        """
+        增量解析正在运行任务的OUTCAR新增内容。
+        Parse only the bytes appended to OUTCAR since the last parsing,
+        e.g. when polling a running job. A truncated trailing block is
+        left for the next refresh. Loaded force arrays, force analysis and
+        energies are extended with the new steps, the OUTCAR is parsed
+        again from the beginning if it is truncated or rewritten (job
+        restarted), which is found by its inode, a hash of its header and
+        the position of the last indexed force block. `restarted` tells
+        whether the last refresh found a rewritten OUTCAR.
+
+        Returns:
+        --------
+        Number of new ionic steps, or number of all ionic steps in the
+        rewritten OUTCAR if `restarted` is True.
+
+        Example:
+        --------
+        >>> outcar = OutCar("OUTCAR")
+        >>> outcar.refresh()
+        2
+        >>> outcar.restarted
+        False
+        >>> outcar.max_forces[-1]
+        """
+        index = self.index
+        nsteps = len(index["forces"])
+        nenergies = len(index["energy"])
+
+        # The file is truncated or rewritten, e.g. the job is restarted.
+        self.restarted = self.__is_rewritten()
+        if self.restarted:
+            for name in self.__refreshed_properties:
+                self.__dict__.pop(name, None)
+            self.__dict__.pop("index", None)
+            self.__buffers.clear()
+            return self.nsteps
+
+        self.__indexed_end = self.__scan_sections(self.__indexed_end, index)
+        self.__drop_incomplete(index)
+        self.__fingerprint = self.__get_fingerprint()
+        if self.cache_index:
+            self.__dump_index(index)
+
+        # Extend loaded data with new steps.
+        offsets = index["forces"][nsteps:]
+        if "force_blocks" in self.__dict__ and offsets:
+            with open(self.filename, "rb") as f:
+                blocks = [self.__read_force_array(f, offset) for offset in offsets]
+            self.__extend("force_blocks", np.array(blocks))
+            if "max_forces" in self.__dict__:
+                self.__analyze_forces(nsteps)
+
+        if "energies" in self.__dict__:
+            offsets = index["energy"][nenergies:]
+            with open(self.filename, "rb") as f:
+                energies = [self.__read_energy(f, offset) for offset in offsets]
+            self.__extend("energies", np.array(energies))
+
+        # Properties of the last step are obtained again.
+        for name in ("total_forces", "last_forces", "last_max_force",
+                     "last_max_atom", "efermi"):
+            self.__dict__.pop(name, None)
+
+        return len(index["forces"]) - nsteps
+
+    def __extend(self, name, rows):
+        """
+        Private helper function to append rows to a loaded array. The
+        array is a view of a buffer whose capacity is doubled when it is
+        full, so a refresh copies only the new rows in amortized time.
+        """
+        data = self.__dict__[name]
+        nrows = len(data) + len(rows)
+        buffer = self.__buffers.get(name)
+        # Not a view of the buffer, e.g. just loaded.
+        if buffer is None or data.base is not buffer:
+            buffer = data
+        if len(buffer) < nrows:
+            shape = (max(2*len(buffer), nrows), ) + data.shape[1:]
+            buffer = np.empty(shape, dtype=data.dtype)
+            buffer[:len(data)] = data
+            self.__buffers[name] = buffer
+        buffer[len(data): nrows] = rows
+        setattr(self, name, buffer[:nrows])
+
+    # Properties depending on the whole OUTCAR, reset if it is rewritten.
+    __refreshed_properties = ("natom", "atom_types", "atom_numbers",
+                              "force_blocks", "max_forces",
+                              "max_atoms", "rms_forces", "energies",
+                              "total_forces", "last_forces", "last_max_force",
+                              "last_max_atom", "efermi")
+
+    @property
+    def nsteps(self):
+        "离子步数. Number of ionic steps with forces in OUTCAR."
+        return len(self.index["forces"])
+
+    def get_index_name(self):
+        "Get name of the JSON file for byte offset index."
+        return self.filename + ".index.json"
+
+    def __scan_sections(self, start, index, chunk_size=1 << 24):
+        """
+        Private helper function to find markers of sections in complete
+        lines from byte `start`, offsets of the lines are appended to index.
+
+        Returns:
+        --------
+        Byte offset after the last complete line.
+        """
+        with open(self.filename, "rb") as f:
+            f.seek(start)
+            base, tail = start, b""
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                buf = tail + chunk
+                end = buf.rfind(b"\n") + 1
+                for name, marker in self.section_markers.items():
+                    i = buf.find(marker, 0, end)
+                    while i >= 0:
+                        head = buf.rfind(b"\n", 0, i) + 1
+                        line = buf[head: buf.find(b"\n", i)]
+                        if name != "forces" or self.__is_force_header(line):
+                            index[name].append(base + head)
+                        i = buf.find(marker, i + len(marker), end)
+                base, tail = base + end, buf[end:]
+
+        return base
+
+    def __load_index(self):
+        """
+        Private helper function to load the byte offset index saved for
+        the same size and mtime of OUTCAR, None if it is missing, stale,
+        malformed or in another format.
+        """
+        index_name = self.get_index_name()
+        if not os.path.exists(index_name):
+            return None
+
+        stat = os.stat(self.filename)
+        try:
+            with open(index_name, "r") as f:
+                saved = json.load(f)
+            if saved["version"] != self.index_version:
+                return None
+            if [saved["size"], saved["mtime_ns"]] != [stat.st_size, stat.st_mtime_ns]:
+                return None
+            sections, end = saved["sections"], saved["end"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.__logger.warning("Ignore invalid index file %s", index_name)
+            return None
+        if set(sections) != set(self.section_markers):
+            return None
+
+        return sections, end
+
+    def __dump_index(self, index):
+        """
+        Private helper function to save the byte offset index to JSON file.
+        """
+        stat = os.stat(self.filename)
+        saved = {"version": self.index_version,
+                 "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                 "end": self.__indexed_end, "sections": index}
+        index_name = self.get_index_name()
+        try:
+            with open(index_name + ".tmp", "w") as f:
+                json.dump(saved, f)
+            os.replace(index_name + ".tmp", index_name)
+        except OSError:
+            pass
+
+    @LazyProperty
+    def natom(self):
+        """
+        原子数。
+        Number of ions (NIONS) in OUTCAR.
+        """
+        with open(self.filename, "rb") as f:
+            for line in f:
+                if b"NIONS" in line:
+                    return int(line.split(b"NIONS")[1].split(b"=")[1].split()[0])
+
+        # Count lines of the first force block.
+        natom = 0
+        with open(self.filename, "rb") as f:
+            for line in f:
+                if self.section_markers["forces"] in line:
+                    break
+            f.readline()
+            for line in f:
+                if b"-"*6 in line:
+                    break
+                natom += 1
+
+        return natom
+
+    def __read_force_array(self, f, offset):
+        """
+        Private helper function to parse the POSITION TOTAL-FORCE block
+        whose header line starts at `offset` into a (natom, 6) array
+        in one shot, f is a file object opened in binary mode.
+        """
+        f.seek(offset)
+        if not self.__is_force_header(f.readline()):
+            msg = "No POSITION TOTAL-FORCE block at byte {} of {}"
+            raise ValueError(msg.format(offset, self.filename))
+        f.readline()  # -------------------------------
+        return file2array(f, self.natom*6).reshape((self.natom, 6))
+
+    def __is_force_header(self, line):
+        """
+        Private helper function to check if a line (bytes) is the header
+        of a POSITION TOTAL-FORCE block.
+        """
+        return self.force_regex.match(line.decode(errors="replace")) is not None
+
+    def __read_force_block(self, offset):
+        """
+        Private helper function to read coordinates and forces in the
+        POSITION TOTAL-FORCE block whose header line starts at `offset`.
+        """
+        with open(self.filename, "rb") as f:
+            block = self.__read_force_array(f, offset)
+
+        return block[:, :3].tolist(), block[:, 3:].tolist()
+
+    def __get_step_offset(self, step):
+        """
+        Private helper function to get byte offset of the force block
+        of a step (start from 1, negative counts from the last).
+        """
+        offsets = self.index["forces"]
+        nsteps = len(offsets)
+        if step == 0 or step > nsteps or step < -nsteps:
+            raise ValueError("Illegal step {} (> {})".format(step, nsteps))
+
+        return offsets[step - 1] if step > 0 else offsets[step]
+
+    def get_force_block(self, step=-1):
+        """
+        获取特定离子步的坐标和受力数组.
+        Get coordinates and forces of a step as a (natom, 6) array,
+        columns are x, y, z, fx, fy, fz.
+
+        Parameters:
+        -----------
+        step: The step number (start from 1), negative number counts from
+              the last step, int.
+        """
+        with open(self.filename, "rb") as f:
+            return self.__read_force_array(f, self.__get_step_offset(step))
+
+    @LazyProperty
+    def force_blocks(self):
+        """
+        所有离子步的坐标和受力数组.
+        Coordinates and forces of all ionic steps, (nsteps, natom, 6) array.
+        """
+        offsets = self.index["forces"]
+        blocks = np.empty((len(offsets), self.natom, 6))
+        with open(self.filename, "rb") as f:
+            for i, offset in enumerate(offsets):
+                blocks[i] = self.__read_force_array(f, offset)
+
+        return blocks
+
+    @property
+    def all_coordinates(self):
+        "Coordinates of all ionic steps, (nsteps, natom, 3) array."
+        return self.force_blocks[:, :, :3]
+
+    @property
+    def all_forces(self):
+        "Forces on atoms of all ionic steps, (nsteps, natom, 3) array."
+        return self.force_blocks[:, :, 3:]
+
     @property
     def iforces(self):
         """
@@ -242,59 +688,67 @@ class OutCar(VasPy):
         # Define namedtuple for item in force iteration.
         ForceItem = namedtuple('ForceItem', ['step', 'coordinates', 'forces'])
 
-        with open(self.filename, "r") as f:
-            ion_step = 0
+        for ion_step, offset in enumerate(self.index["forces"], 1):
+            coordinates, forces = self.__read_force_block(offset)
+            yield ForceItem._make([ion_step, coordinates, forces])
 
-            # Force data collection flags.
-            collect_begin = False
-            collecting = False
+    @property
+    def tf_mask(self):
+        """
+        可移动(T)坐标的布尔掩码。
+        Boolean mask of movable (T) coordinates of atoms, (natom, 3) array.
+        T/F info is taken from POSCAR, all coordinates are movable if
+        there is no POSCAR.
+        """
+        if "poscar" not in self.__dict__ and not self.__has_poscar():
+            return np.ones((self.natom, 3), dtype=bool)
 
-            # Collect force data for each ionic step and yield.
-            for line in f:
-                if not collect_begin:
-                    if self.force_regex.match(line):
-                        collect_begin = True
-                        ion_step += 1
-                elif not collecting:
-                    if "-"*6 in line:
-                        collecting = True
-                        coordinates = []
-                        forces = []
-                else:
-                    if "-"*6 in line:
-                        collecting = False
-                        collect_begin = False
-                        yield ForceItem._make([ion_step, coordinates, forces])
-                    else:
-                        x, y, z, fx, fy, fz = line2list(line)
-                        coordinates.append([x, y, z])
-                        forces.append([fx, fy, fz])
+        return np.asarray(self.poscar.tf) != "F"
 
-    def __mask_forces(self, atom_forces, tfs):
+    def __has_poscar(self):
         """
-        Private helper function to use F/T info to mask forces.
+        Private helper function to check if POSCAR exists, warn once
+        if the given POSCAR is missing.
+        """
+        if self.poscar_name is None:
+            return False
 
-        Returns:
-        --------
-        Masked forces 2D array.
+        exists = os.path.exists(self.poscar_name)
+        if not exists and not self.__poscar_warned:
+            self.__logger.warning("POSCAR '%s' not found, all coordinates are movable",
+                                  self.poscar_name)
+            self.__poscar_warned = True
+
+        return exists
+
+    def __mask_force_array(self, atom_forces, tfs):
         """
+        Private helper function to zero forces on fixed (F) coordinates,
+        forces of one step (natom x 3) or all steps (nsteps x natom x 3).
+        """
+        atom_forces = np.asarray(atom_forces, dtype=np.float64)
+        tfs = np.asarray(tfs)
+
         # Check atom forces.
-        if len(tfs) != len(atom_forces):
+        if len(tfs) != atom_forces.shape[-2]:
             msg = "Length of atom forces({}) must be equal to length of atoms({})."
-            msg = msg.format(len(atom_forces), len(tfs))
+            msg = msg.format(atom_forces.shape[-2], len(tfs))
             raise ValueError(msg)
 
-        masked_forces = []
-        for tf_vector, forces in zip(tfs, atom_forces):
-            masked_force = []
-            for tf, force in zip(tf_vector, forces):
-                if tf == "F":
-                    masked_force.append(0.0)
-                else:
-                    masked_force.append(force)
-            masked_forces.append(masked_force)
+        if tfs.dtype != bool:
+            tfs = tfs != "F"
 
-        return masked_forces
+        return np.where(tfs, atom_forces, 0.0)
+
+    def __mask_forces(self, atom_forces, tfs):
+        """
+        Private helper function to use F/T info to mask forces.
+
+        Returns:
+        --------
+        Masked forces 2D array.
+        """
+        return self.__mask_force_array(atom_forces, tfs).tolist()
 
     def fmax(self, atom_forces):
         """
@@ -310,35 +764,89 @@ class OutCar(VasPy):
         NOTE: atom number start from **1 NOT 0**
         """
         # Mask forces.
-        masked_forces = self.__mask_forces(atom_forces, self.poscar.tf)
+        masked_forces = self.__mask_force_array(atom_forces, self.tf_mask)
 
         # Get max forces.
-        max_force = max(masked_forces, key=lambda x: sum([i**2 for i in x]))
-        index = masked_forces.index(max_force)
+        index = int(np.argmax(np.sum(masked_forces**2, axis=1)))
+
+        return index + 1, masked_forces[index].tolist()
+
+    def __analyze_forces(self, start=0):
+        """
+        Private helper function to get max force, atom number with max
+        force and RMS force of all ionic steps at once, results of steps
+        before `start` are kept.
+        """
+        forces = self.__mask_force_array(self.all_forces[start:], self.tf_mask)
+        squares = forces**2
+        norms = np.sqrt(np.sum(squares, axis=2))
+
+        max_atoms = np.argmax(norms, axis=1)
+        max_forces = norms[np.arange(len(norms)), max_atoms]
+
+        # RMS over components of movable coordinates.
+        nfree = max(np.count_nonzero(self.tf_mask), 1)
+        rms_forces = np.sqrt(np.sum(squares, axis=(1, 2))/nfree)
+
+        max_atoms += 1
+
+        if start > 0:
+            self.__extend("max_forces", max_forces)
+            self.__extend("max_atoms", max_atoms)
+            self.__extend("rms_forces", rms_forces)
+        else:
+            self.max_forces = max_forces
+            self.max_atoms = max_atoms
+            self.rms_forces = rms_forces
+
+    @LazyProperty
+    def max_forces(self):
+        """
+        每个离子步的原子最大受力（合力）。
+        Max force on movable atoms of every ionic step, 1D array.
+        """
+        self.__analyze_forces()
+        return self.max_forces
+
+    @LazyProperty
+    def max_atoms(self):
+        """
+        每个离子步受力最大原子的原子序号(从1开始)。
+        Atom number (start from 1) with max force of every ionic step.
+        """
+        self.__analyze_forces()
+        return self.max_atoms
 
-        return index + 1, max_force
+    @LazyProperty
+    def rms_forces(self):
+        """
+        每个离子步的均方根受力。
+        RMS force over movable coordinates of every ionic step, 1D array.
+        """
+        self.__analyze_forces()
+        return self.rms_forces
 
     def forces(self, step=-1):
         """
         获取特定离子步的原子受力信息
-        Function to get forces info for a specific step.
+        Function to get forces info for a specific step, the force block
+        is read directly with the byte offset index.
 
         Parameters:
         -----------
-        step: The step number, int.
+        step: The step number (start from 1), negative number counts from
+              the last step, int. Or a slice of the sequence of steps,
+              e.g. slice(-10, None) for the last 10 steps.
 
         Return:
         -------
-        Coordinates and forces for that step.
+        Coordinates and forces for that step, a list of them for a slice.
         """
-        for i, coord, forces in self.iforces:
-            if step != -1 and i == step:
-                return coord, forces
+        if isinstance(step, slice):
+            offsets = self.index["forces"][step]
+            return [self.__read_force_block(offset) for offset in offsets]
 
-        if step == -1:
-            return coord, forces
-        elif step > i:
-            raise ValueError("Illegal step {} (> {})".format(step, i))
+        return self.__read_force_block(self.__get_step_offset(step))
 
     @LazyProperty
     def total_forces(self):
@@ -346,13 +854,7 @@ class OutCar(VasPy):
         获取离子步迭代的原子最大受力（合力）列表。
         Function to get max force for every ionic step.
         """
-        max_forces = []
-        for _, _, forces in self.iforces:
-            _, fvector = self.fmax(forces)
-            max_force = np.linalg.norm(fvector)
-            max_forces.append(max_force)
-
-        return max_forces
+        return self.max_forces.tolist()
 
     @LazyProperty
     def last_forces(self):
@@ -388,6 +890,49 @@ class OutCar(VasPy):
         atom_number, _ = self.fmax(self.last_forces)
         return atom_number
 
+    @LazyProperty
+    def efermi(self):
+        """
+        最后一个离子步的费米能级(eV)。
+        Function to get Fermi level (eV) of the last ionic step.
+        """
+        efermi = None
+        offsets = self.index["efermi"]
+        if offsets:
+            with open(self.filename, "rb") as f:
+                f.seek(offsets[-1])
+                m = self.efermi_regex.match(f.readline().decode())
+                if m:
+                    efermi = float(m.group(1))
+
+        if efermi is None:
+            msg = "'{}' has no attribtue '{}'".format(self.__class__.__name__, "efermi")
+            raise AttributeError(msg)
+
+        return efermi
+
+    @LazyProperty
+    def energies(self):
+        """
+        每个离子步的自由能TOTEN(eV)。
+        Function to get free energy TOTEN (eV) of every ionic step.
+        """
+        with open(self.filename, "rb") as f:
+            energies = [self.__read_energy(f, offset)
+                        for offset in self.index["energy"]]
+
+        return np.array(energies)
+
+    def __read_energy(self, f, offset):
+        """
+        Private helper function to read TOTEN in the free energy section
+        whose header line starts at `offset`.
+        """
+        f.seek(offset)
+        for line in f:
+            if b"TOTEN" in line:
+                return float(line.split(b"=")[1].split()[0])
+
     @property
     def ifreq(self):
         """
@@ -0,0 +1,568 @@
+# -*- coding:utf-8 -*-
+'''
+ChgCar单元测试
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from ..electro import ChgCar, PeriodicView, GridWriter, chgcar_diff, \
+                      pyvista_installed
+from ..errors import UnmatchedDataShape
+from . import path
+
+
+class ChgCarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.maxDiff = True
+        self.filename = path + "/CHGCAR"
+
+    def test_load(self):
+        " Make sure we can load the volumetric data correctly. "
+        chgcar = ChgCar(self.filename)
+
+        self.assertListEqual(chgcar.atom_types, ["Li", "H"])
+        self.assertListEqual(chgcar.atom_numbers, [1, 1])
+        self.assertTupleEqual(chgcar.grid, (8, 6, 5))
+        self.assertTupleEqual(chgcar.elf_data.shape, (8, 6, 5))
+
+        # NGX is the fastest axis in file.
+        self.assertAlmostEqual(chgcar.elf_data[0, 0, 0], 40.010176247)
+        self.assertAlmostEqual(chgcar.elf_data[1, 0, 0], 24.272797261)
+        self.assertAlmostEqual(chgcar.elf_data[0, 1, 0], 19.481762423)
+        self.assertAlmostEqual(chgcar.elf_data[-1, -1, -1], 5.8483220695)
+
+        # Augmentation occupancies must not leak into the grid.
+        self.assertAlmostEqual(np.sum(chgcar.elf_data), 972.78661638, places=5)
+
+    def test_lazy_load(self):
+        " Make sure the lazy mode defers loading of volumetric data. "
+        chgcar = ChgCar(self.filename, lazy=True)
+
+        self.assertTupleEqual(chgcar.grid, (8, 6, 5))
+        self.assertListEqual(chgcar.atom_types, ["Li", "H"])
+        self.assertTrue(np.allclose(chgcar.bases[1], [0.0, 3.6, 0.0]))
+        self.assertFalse("elf_data" in chgcar.__dict__)
+
+        ref_data = ChgCar(self.filename).elf_data
+        self.assertTrue(np.array_equal(ref_data, chgcar.elf_data))
+        self.assertTrue("elf_data" in chgcar.__dict__)
+
+    def test_parallel_load(self):
+        " Test parsing volumetric data in parallel. "
+        ref = ChgCar(path + "/CHGCAR_spin")
+        for nprocs in (2, 3, 7):
+            chgcar = ChgCar(path + "/CHGCAR_spin", nprocs=nprocs)
+            self.assertTrue(np.array_equal(ref.elf_data, chgcar.elf_data))
+            self.assertTrue(np.array_equal(ref.mag_data, chgcar.mag_data))
+
+        # The last line of file has no newline.
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "CHGCAR")
+            with open(self.filename, 'rb') as f:
+                content = f.read()
+            content = content[: content.index(b'augmentation')].rstrip()
+            with open(filename, 'wb') as f:
+                f.write(content)
+            chgcar = ChgCar(filename, nprocs=4)
+            ref = ChgCar(self.filename)
+            self.assertTrue(np.array_equal(ref.elf_data, chgcar.elf_data))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        # A mapped file can't be removed, e.g. on Windows.
+        remove = os.remove
+        removed = []
+
+        def remove_unmapped(name):
+            if not removed:
+                removed.append(name)
+                raise PermissionError(name)
+            remove(name)
+
+        with mock.patch("os.remove", side_effect=remove_unmapped):
+            chgcar = ChgCar(self.filename, nprocs=2)
+        self.assertFalse(isinstance(chgcar.elf_data.base, np.memmap))
+        self.assertFalse(os.path.exists(removed[0]))
+        self.assertTrue(np.array_equal(ref.elf_data, chgcar.elf_data))
+
+    def test_cache(self):
+        " Make sure the sidecar cache is written and memory-mapped. "
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "CHGCAR")
+            shutil.copy(self.filename, filename)
+
+            chgcar = ChgCar(filename, cache=True)
+            cache_name = chgcar.get_cache_name("elf_data")
+            self.assertTrue(os.path.exists(cache_name))
+
+            cached = ChgCar(filename, cache=True)
+            self.assertTrue(isinstance(cached.elf_data, np.memmap))
+            self.assertTrue(np.array_equal(chgcar.elf_data, cached.elf_data))
+
+            # Stale sidecar is replaced once the file changes.
+            with open(filename, "a") as f:
+                f.write("\n")
+            del cached
+            changed = ChgCar(filename, cache=True)
+            self.assertNotEqual(cache_name, changed.get_cache_name("elf_data"))
+            self.assertFalse(os.path.exists(cache_name))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_float32(self):
+        " Test holding and caching volumetric data as float32. "
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "CHGCAR")
+            shutil.copy(path + "/CHGCAR_spin", filename)
+            ref = ChgCar(filename, cache=True)
+
+            chgcar = ChgCar(filename, cache=True, dtype=np.float32)
+            self.assertEqual(chgcar.elf_data.dtype, np.float32)
+            self.assertEqual(chgcar.mag_data.dtype, np.float32)
+            self.assertTrue(np.allclose(ref.elf_data, chgcar.elf_data, rtol=1e-6))
+
+            # Sidecar files of both dtypes are kept.
+            self.assertTrue(os.path.exists(ref.get_cache_name("elf_data")))
+            cached = ChgCar(filename, cache=True, dtype=np.float32)
+            self.assertEqual(cached.elf_data.dtype, np.float32)
+            self.assertTrue(isinstance(cached.elf_data, np.memmap))
+
+            # Streamed chunks and reductions.
+            lazy = ChgCar(filename, lazy=True, dtype=np.float32)
+            _, chunk = next(lazy.iter_chunks())
+            self.assertEqual(chunk.dtype, np.float32)
+            _, values = lazy.planar_average()
+            _, ref_values = ref.planar_average()
+            self.assertEqual(values.dtype, np.float64)
+            self.assertTrue(np.allclose(values, ref_values, rtol=1e-6))
+            charges = chgcar.integrate_voronoi()
+            self.assertTrue(np.allclose(charges, ref.integrate_voronoi(), rtol=1e-6))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_spin_polarized(self):
+        " Make sure total and magnetization blocks are loaded separately. "
+        filename = path + "/CHGCAR_spin"
+        chgcar = ChgCar(filename, lazy=True)
+
+        self.assertEqual(len(chgcar.block_offsets), 2)
+        self.assertFalse("elf_data" in chgcar.__dict__)
+
+        mag_data = chgcar.mag_data
+        self.assertTupleEqual(mag_data.shape, (6, 4, 5))
+        self.assertAlmostEqual(mag_data[0, 0, 0], 2.9999998648)
+        self.assertAlmostEqual(mag_data[3, 1, 0], -0.0060787690319)
+        self.assertFalse("elf_data" in chgcar.__dict__)
+
+        elf_data = chgcar.elf_data
+        self.assertAlmostEqual(elf_data[0, 0, 0], 40.010176247)
+        self.assertAlmostEqual(elf_data[-1, -1, -1], 1.9516568363)
+
+        # No magnetization in non spin-polarized CHGCAR.
+        chgcar = ChgCar(self.filename)
+        self.assertEqual(len(chgcar.block_offsets), 1)
+        self.assertFalse(hasattr(chgcar, "mag_data"))
+
+    def test_aug_occupancies(self):
+        " Make sure augmentation occupancies are indexed and parsed. "
+        filename = path + "/CHGCAR_spin"
+        chgcar = ChgCar(filename, lazy=True)
+
+        self.assertListEqual([[(1, 15), (2, 8)], [(1, 15), (2, 8)]],
+                             [[item[:2] for item in offsets]
+                              for offsets in chgcar.aug_offsets])
+
+        occupancies = chgcar.aug_occupancies
+        self.assertListEqual([15, 8], [len(i) for i in occupancies])
+        self.assertAlmostEqual(occupancies[0][0], 0.1502132)
+        self.assertAlmostEqual(occupancies[1][-1], 0.088054507)
+
+        mag_occupancies = chgcar.load_aug_occupancies(1)
+        self.assertEqual(len(mag_occupancies), 2)
+
+    def test_expand_data(self):
+        " Make sure data can be replicated periodically. "
+        chgcar = ChgCar(self.filename)
+        data, grid = chgcar.expand_data(chgcar.elf_data, chgcar.grid, (3, 2, 1))
+
+        self.assertListEqual(grid.tolist(), [24, 12, 5])
+        self.assertTupleEqual(data.shape, (24, 12, 5))
+        self.assertTrue(np.array_equal(data[8:16, 6:, :], chgcar.elf_data))
+
+        # Virtual replication.
+        view = PeriodicView(chgcar.elf_data, (3, 2, 1))
+        self.assertTupleEqual(view.shape, (24, 12, 5))
+        self.assertTrue(np.array_equal(view[:, :, 2], data[:, :, 2]))
+        self.assertTrue(np.array_equal(view[10, 1:9:3, :], data[10, 1:9:3, :]))
+        self.assertEqual(view[-1, -1, -1], data[-1, -1, -1])
+        self.assertTrue(np.array_equal(np.asarray(view), data))
+
+    def test_interpolate_slice(self):
+        " Make sure slices are interpolated periodically. "
+        chgcar = ChgCar(self.filename)
+        z = chgcar.elf_data[:, :, 0]
+
+        for method in ("fourier", "cubic"):
+            newz = chgcar.interpolate_slice(z, (33, 25), method=method)
+            self.assertTupleEqual(newz.shape, (33, 25))
+            # Grid points are kept and both ends of period are the same.
+            self.assertTrue(np.allclose(newz[::4, ::4][:-1, :-1], z))
+            self.assertTrue(np.allclose(newz[0, :], newz[-1, :]))
+            self.assertTrue(np.allclose(newz[:, 0], newz[:, -1]))
+
+        # Interpolant is reused.
+        self.assertEqual(len(chgcar._ElfCar__slice_interps), 2)
+        chgcar.interpolate_slice(z.copy(), (600, 600))
+        self.assertEqual(len(chgcar._ElfCar__slice_interps), 2)
+
+        # Only the last few interpolants are kept.
+        for i in range(1, chgcar.grid[2]):
+            chgcar.interpolate_slice(chgcar.elf_data[:, :, i], (9, 9))
+        self.assertEqual(len(chgcar._ElfCar__slice_interps), 4)
+
+    def test_slice_plane(self):
+        " Make sure data can be sampled on arbitrary planes. "
+        chgcar = ChgCar(self.filename)
+
+        # Plane through grid points of the 3rd layer along z axis.
+        values, points = chgcar.slice_plane([0.0, 0.0, 1.2], [0.0, 0.0, 1.0],
+                                            size=(4.0, 3.6), npoints=(9, 7))
+        self.assertTupleEqual(values.shape, (9, 7))
+        self.assertTupleEqual(points.shape, (9, 7, 3))
+        self.assertTrue(np.allclose(points[0, 0], [-2.0, -1.8, 1.2]))
+        ref_values = chgcar.elf_data[np.arange(-4, 5) % 8][:, np.arange(-3, 4) % 6, 2]
+        self.assertTrue(np.allclose(values, ref_values))
+
+        # Diagonal plane centered on a grid point.
+        values, points = chgcar.slice_plane([2.0, 1.8, 1.2], [1.0, -1.0, 0.0],
+                                            npoints=(5, 5), order=3)
+        normal_distances = np.dot(points - [2.0, 1.8, 1.2], [1.0, -1.0, 0.0])
+        self.assertTrue(np.allclose(normal_distances, 0.0))
+        self.assertAlmostEqual(values[2, 2], chgcar.elf_data[4, 3, 2])
+
+        self.assertRaises(ValueError, chgcar.slice_plane, atoms=(0, 1, 1))
+
+    def test_probe(self):
+        " Test batched interpolation at points. "
+        chgcar = ChgCar(self.filename)
+        data = chgcar.elf_data
+
+        # Grid points, periodic images included.
+        frac = np.array([[0.0, 0.0, 0.0], [3/8, 4/6, 2/5], [1.0, -1/6, 1.0]])
+        ref = [data[0, 0, 0], data[3, 4, 2], data[0, 5, 0]]
+        for order in (1, 3):
+            self.assertTrue(np.allclose(chgcar.probe(frac, order=order), ref))
+
+        # Trilinear interpolation between grid points.
+        value = chgcar.probe([1.5/8, 0.0, 0.0])
+        self.assertAlmostEqual(value, (data[1, 0, 0] + data[2, 0, 0])/2)
+
+        # Cartesian coordinates and batched shape.
+        frac = np.random.rand(2, 4, 3)
+        cart = np.dot(frac, chgcar.bases*chgcar.bases_const)
+        values = chgcar.probe(cart, cartesian=True, order=3)
+        self.assertTupleEqual(values.shape, (2, 4))
+        self.assertTrue(np.allclose(values, chgcar.probe(frac, order=3)))
+        self.assertTrue(np.allclose(values, chgcar.probe(frac, order=3, keep_coeffs=False)))
+
+        # Spline coefficients are cached.
+        coeffs = chgcar.get_spline_coeffs()
+        self.assertIs(coeffs, chgcar.get_spline_coeffs())
+        chgcar.elf_data = data*2.0
+        self.assertIsNot(coeffs, chgcar.get_spline_coeffs())
+        self.assertTrue(np.allclose(chgcar.probe(frac, order=3), values*2.0))
+
+        self.assertRaises(ValueError, chgcar.probe, frac, order=2)
+
+    def test_planar_average(self):
+        " Make sure we can get planar and macroscopic averages. "
+        chgcar = ChgCar(self.filename)
+        elf_data = chgcar.elf_data
+
+        z, values = chgcar.planar_average('z')
+        self.assertTrue(np.allclose(z, np.arange(5)*0.6))
+        self.assertTrue(np.allclose(values, elf_data.mean(axis=(0, 1))))
+
+        x, values = chgcar.planar_average('x')
+        self.assertTrue(np.allclose(x, np.arange(8)*0.5))
+        self.assertTrue(np.allclose(values, elf_data.mean(axis=(1, 2))))
+
+        # Stream from file in lazy mode.
+        chgcar = ChgCar(self.filename, lazy=True)
+        _, values = chgcar.planar_average('y', nlayer=2)
+        self.assertTrue(np.allclose(values, elf_data.mean(axis=(0, 2))))
+        self.assertFalse("elf_data" in chgcar.__dict__)
+
+        # Window of the whole period gives the average.
+        _, values = chgcar.macroscopic_average(4.0, axis='x')
+        self.assertTrue(np.allclose(values, elf_data.mean()))
+        _, values = chgcar.macroscopic_average((1.0, 1.5), axis='x')
+        self.assertAlmostEqual(np.mean(values), elf_data.mean())
+
+        # Windows are centered and cover exactly one period.
+        chgcar = ChgCar(self.filename)
+        chgcar.grid = (20, 1, 1)
+        chgcar.bases = np.diag([10.0, 1.0, 1.0])
+        chgcar.elf_data = np.zeros((20, 1, 1))
+        chgcar.elf_data[10] = 1.0
+        for period in (1.0, 2.0, 2.3):
+            x, values = chgcar.macroscopic_average(period, axis='x')
+            self.assertAlmostEqual(np.sum(values), 1.0)
+            self.assertTrue(np.allclose(values, np.roll(values[::-1], 1)))
+            self.assertAlmostEqual(np.sum(x*values), x[10])
+            self.assertAlmostEqual(values[10], 0.5/period)
+
+        # Magnetization of spin-polarized CHGCAR.
+        chgcar = ChgCar(path + "/CHGCAR_spin", lazy=True)
+        _, values = chgcar.planar_average('z', name='mag_data', nlayer=3)
+        self.assertTrue(np.allclose(values, chgcar.mag_data.mean(axis=(0, 1))))
+
+    def test_chgcar_diff(self):
+        " Make sure charge density difference can be streamed to file. "
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ref_diff = -ChgCar(self.filename).elf_data
+
+            # Binary output.
+            filename = os.path.join(tmpdir, "chgdiff.npy")
+            chgcar_diff(self.filename, self.filename, self.filename,
+                        filename, nlayer=2)
+            self.assertTrue(np.allclose(np.load(filename), ref_diff))
+
+            # CHGCAR output.
+            filename = os.path.join(tmpdir, "CHGDIFF")
+            chgcar_diff(self.filename, self.filename, self.filename,
+                        filename, nlayer=2)
+            chgdiff = ChgCar(filename)
+            self.assertListEqual(chgdiff.atom_types, ["Li", "H"])
+            self.assertTrue(np.allclose(chgdiff.elf_data, ref_diff))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        # Grids must match.
+        self.assertRaises(UnmatchedDataShape, chgcar_diff, self.filename,
+                          self.filename, path + "/CHGCAR_spin")
+
+    def test_pyramid(self):
+        " Test the downsampling pyramid of volumetric data. "
+        chgcar = ChgCar(self.filename)
+        data = chgcar.elf_data
+
+        level1 = chgcar.get_pyramid_level(1)
+        self.assertTupleEqual(level1.shape, (4, 3, 3))
+        self.assertAlmostEqual(level1[1, 2, 0], np.mean(data[2:4, 4:6, 0:2]))
+        # Odd axis is wrapped.
+        self.assertAlmostEqual(level1[0, 0, 2], np.mean(data[0:2, 0:2, [4, 0]]))
+        self.assertIs(level1, chgcar.get_pyramid_level(1))
+        self.assertIs(data, chgcar.get_pyramid_level(0))
+
+        level3 = chgcar.get_pyramid_level(3)
+        self.assertTupleEqual(level3.shape, (1, 1, 1))
+        self.assertRaises(ValueError, chgcar.get_pyramid_level, 4)
+
+        self.assertEqual(chgcar.select_pyramid_level(240), 0)
+        self.assertEqual(chgcar.select_pyramid_level(239), 1)
+        self.assertEqual(chgcar.select_pyramid_level(36), 1)
+        self.assertEqual(chgcar.select_pyramid_level(36, (2, 1, 1)), 2)
+        self.assertEqual(chgcar.select_pyramid_level(0), 3)
+
+        chgcar.clear_pyramid()
+        self.assertIsNot(level1, chgcar.get_pyramid_level(1))
+
+        # Replaced data are found without clearing.
+        chgcar.elf_data = data*2.0
+        self.assertTrue(np.allclose(chgcar.get_pyramid_level(3), level3*2.0))
+
+        # Points are at the centers of averaged blocks.
+        x, y, z = chgcar.get_pyramid_coords(1)
+        self.assertTrue(np.allclose(x, (np.arange(4)*2 + 0.5)/8))
+        self.assertTrue(np.allclose(y, (np.arange(3)*2 + 0.5)/6))
+        self.assertTrue(np.allclose(z, [0.1, 0.5, 0.9]))
+        x, y, z = chgcar.get_pyramid_coords(2)
+        self.assertTrue(np.allclose(x, [0.1875, 0.6875]))
+        self.assertTrue(np.allclose(y, [0.25, 11.0/12]))
+        self.assertTrue(np.allclose(z, [0.3, 1.0]))
+
+    @unittest.skipUnless(pyvista_installed, "pyvista is not installed")
+    def test_build_structured_grid(self):
+        " Test the pyvista grid geometry is cached. "
+        chgcar = ChgCar(self.filename)
+        data = chgcar.elf_data
+
+        # Orthogonal cell, implicit geometry.
+        pvgrid = chgcar._build_structured_grid(data, chgcar.grid)
+        self.assertEqual(pvgrid.n_points, data.size)
+        self.assertTrue(np.allclose(pvgrid.bounds[1::2], [3.5, 3.0, 2.4]))
+        self.assertNotEqual(type(pvgrid).__name__, 'StructuredGrid')
+
+        # Only scalars are swapped.
+        same = chgcar._build_structured_grid(data*2.0, chgcar.grid)
+        self.assertIs(pvgrid, same)
+        self.assertTrue(np.allclose(same.point_data['values'], data.ravel(order='F')*2.0))
+
+        # Skewed cell.
+        chgcar.bases = np.array([[4.0, 0.0, 0.0],
+                                 [1.2, 3.6, 0.0],
+                                 [0.0, 0.0, 3.0]])
+        skewed = chgcar._build_structured_grid(data, chgcar.grid)
+        self.assertIsNot(pvgrid, skewed)
+        self.assertTrue(np.allclose(skewed.points[8], [0.2, 0.6, 0.0]))
+
+        # Downsampled levels are placed at centers of averaged blocks.
+        chgcar.bases = np.diag([4.0, 3.6, 3.0])
+        level, coords = chgcar.get_pyramid_level(1), chgcar.get_pyramid_coords(1)
+        coarse = chgcar._build_structured_grid(level, level.shape, coords=coords)
+        self.assertEqual(coarse.n_points, level.size)
+        self.assertTrue(np.allclose(coarse.points[0], [0.25, 0.3, 0.3]))
+        self.assertTrue(np.allclose(coarse.bounds[1::2], [3.25, 2.7, 2.7]))
+
+    def test_isosurface_measures(self):
+        " Test volume and area of isosurfaces. "
+        chgcar = ChgCar(self.filename)
+        volume, area = chgcar.get_isosurface_measures(chgcar.elf_data.min() - 1.0)
+        self.assertAlmostEqual(volume, 4.0*3.6*3.0)
+        self.assertEqual(area, 0.0)
+
+        # Sphere of radius 3 in a skewed cell.
+        n = 60
+        chgcar.bases = np.array([[10.0, 0.0, 0.0],
+                                 [3.0, 10.0, 0.0],
+                                 [1.0, -2.0, 10.0]])
+        chgcar.bases_const = 1.0
+        chgcar.grid = (n, n, n)
+        frac = np.stack(np.meshgrid(*[np.arange(n)/n]*3, indexing='ij'), axis=-1)
+        cart = np.dot(frac - 0.5, chgcar.bases)
+        chgcar.elf_data = np.exp(-np.sum(cart**2, axis=-1))
+
+        radius = 3.0
+        volumes, areas = chgcar.get_isosurface_measures([np.exp(-radius**2), 2.0])
+        self.assertAlmostEqual(volumes[0]/(4.0/3.0*np.pi*radius**3), 1.0, places=1)
+        self.assertAlmostEqual(areas[0]/(4.0*np.pi*radius**2), 1.0, places=1)
+        self.assertListEqual([volumes[1], areas[1]], [0.0, 0.0])
+
+        # Batches give the same result.
+        volume, area = chgcar.get_isosurface_measures(np.exp(-radius**2), batch_size=100)
+        self.assertAlmostEqual(volume, volumes[0])
+        self.assertAlmostEqual(area, areas[0])
+
+        # Unsorted isovalues keep their order and shape.
+        isovalues = np.array([[0.5, 0.1], [0.9, 0.3]])
+        volumes, areas = chgcar.get_isosurface_measures(isovalues)
+        self.assertTupleEqual(volumes.shape, (2, 2))
+        for iso, volume, area in zip(isovalues.ravel(), volumes.ravel(), areas.ravel()):
+            self.assertTupleEqual((volume, area), chgcar.get_isosurface_measures(iso))
+        self.assertTrue(np.all(np.diff(volumes.ravel()[[2, 0, 3, 1]]) > 0))
+
+        # Replaced data are found without clearing.
+        chgcar.elf_data = chgcar.elf_data*2.0
+        volume, area = chgcar.get_isosurface_measures(2*np.exp(-radius**2))
+        self.assertAlmostEqual(volume/(4.0/3.0*np.pi*radius**3), 1.0, places=1)
+
+    def test_derivatives(self):
+        " Test spectral gradient, Laplacian and RDG on a skewed cell. "
+        chgcar = ChgCar(self.filename)
+        chgcar.bases = np.array([[4.0, 0.0, 0.0],
+                                 [1.2, 3.6, 0.0],
+                                 [0.5, -0.4, 3.0]])
+        bases = chgcar.bases*chgcar.bases_const
+        volume = abs(np.linalg.det(bases))
+
+        # rho = 2 + cos(G.r) with G = 2pi (1, 2, -1) in reciprocal bases.
+        nx, ny, nz = chgcar.grid
+        frac = np.stack(np.meshgrid(np.arange(nx)/nx, np.arange(ny)/ny,
+                                    np.arange(nz)/nz, indexing='ij'))
+        phase = 2*np.pi*np.einsum('i,i...->...', [1, 2, -1], frac)
+        rho = 2.0 + np.cos(phase)
+        chgcar.elf_data = rho*volume
+        G = np.dot([1, 2, -1], chgcar.reciprocal_bases)
+
+        gradient = chgcar.get_gradient()
+        ref_gradient = -np.sin(phase)[None]*G[:, None, None, None]
+        self.assertTrue(np.allclose(gradient, ref_gradient))
+        self.assertIs(gradient, chgcar.get_gradient())
+
+        norm = chgcar.get_gradient_norm()
+        self.assertTrue(np.allclose(norm, np.abs(np.sin(phase))*np.linalg.norm(G)))
+
+        laplacian = chgcar.get_laplacian()
+        self.assertTrue(np.allclose(laplacian, -np.dot(G, G)*np.cos(phase)))
+
+        rdg = chgcar.get_reduced_gradient()
+        ref_rdg = norm/(2*(3*np.pi**2)**(1.0/3)*rho**(4.0/3))
+        self.assertTrue(np.allclose(rdg, ref_rdg))
+
+        chgcar.clear_derivatives()
+        self.assertIsNot(gradient, chgcar.get_gradient())
+
+        # Replaced data are found without clearing.
+        chgcar.elf_data = 2*chgcar.elf_data
+        self.assertTrue(np.allclose(chgcar.get_gradient(), 2*ref_gradient))
+
+    def test_integrate_charges(self):
+        " Make sure we can integrate charges around atoms. "
+        chgcar = ChgCar(self.filename)
+        ref_total = np.sum(chgcar.elf_data)/chgcar.elf_data.size
+
+        charges = chgcar.integrate_spheres({"Li": 1.0, "H": 0.8})
+        self.assertTrue(np.allclose(charges, [1.48654244, 0.69639772]))
+        self.assertTrue(np.allclose(chgcar.integrate_spheres([1.0, 0.8]), charges))
+
+        # Spheres covering the whole cell.
+        charges = chgcar.integrate_spheres(10.0)
+        self.assertTrue(np.allclose(charges, ref_total))
+
+        # Voronoi cells partition the cell.
+        chgcar = ChgCar(self.filename, lazy=True)
+        charges = chgcar.integrate_voronoi(nlayer=2)
+        self.assertTrue(np.allclose(charges, [1.8602304, 2.19304717]))
+        self.assertAlmostEqual(np.sum(charges), ref_total)
+
+    def test_tofile(self):
+        " Make sure volumetric data can be written in VASP's layout. "
+        values = [40.010176247, -0.0060787690319, 0.0, 1.0, 9.99999999999,
+                  999.9999999999999, 1e-120, -3.2e-50]
+        ref_content = (b" 0.40010176247E+02 -.60787690319E-02 0.00000000000E+00"
+                       b" 0.10000000000E+01 0.10000000000E+02\n"
+                       b" 0.10000000000E+04 0.00000000000E+00 -.32000000000E-49\n")
+        content = (GridWriter.format_lines(values[:5], 5) +
+                   GridWriter.format_lines(values[5:], 3))
+        self.assertEqual(ref_content, content)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "CHGCAR_c")
+
+            # The written file is the same as the original one.
+            chgcar = ChgCar(self.filename, lazy=True)
+            chgcar.tofile(filename, nlayer=3)
+            with open(self.filename, "rb") as f:
+                ref_data = f.read()[chgcar.data_offset:].split(b"augmentation")[0]
+            offset = ChgCar(filename, lazy=True).data_offset
+            with open(filename, "rb") as f:
+                self.assertEqual(ref_data, f.read()[offset:])
+
+            # Modified data.
+            chgcar.elf_data = chgcar.elf_data*2.0
+            chgcar.tofile(filename)
+            new_chgcar = ChgCar(filename)
+            self.assertTrue(np.allclose(new_chgcar.elf_data, chgcar.elf_data))
+            self.assertTrue(np.allclose(new_chgcar.bases, chgcar.bases))
+            # Title of the original file is kept.
+            self.assertEqual(new_chgcar.title, "Li H" + " "*36)
+
+            # Magnetization block.
+            chgcar = ChgCar(path + "/CHGCAR_spin", lazy=True)
+            chgcar.tofile(filename, name="mag_data")
+            self.assertTrue(np.allclose(ChgCar(filename).elf_data, chgcar.mag_data))
+        finally:
+            shutil.rmtree(tmpdir)
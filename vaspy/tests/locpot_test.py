@@ -0,0 +1,42 @@
+# -*- coding:utf-8 -*-
+'''
+LocPot单元测试
+'''
+
+import unittest
+
+import numpy as np
+
+from ..electro import LocPot
+from ..iter import OutCar
+from . import path
+
+
+class LocPotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.maxDiff = True
+        self.filename = path + "/LOCPOT"
+
+    def test_vacuum_level(self):
+        " Make sure we can find the vacuum plateau. "
+        locpot = LocPot(self.filename, lazy=True)
+        vacuum_level, (start, end) = locpot.get_vacuum_level()
+
+        self.assertAlmostEqual(vacuum_level, 4.4999001, places=6)
+        self.assertAlmostEqual(start, 10.5)
+        self.assertAlmostEqual(end, 17.5)
+
+        # No plateau is wide enough.
+        self.assertRaises(ValueError, locpot.get_vacuum_level, min_width=10.0)
+
+    def test_work_function(self):
+        " Make sure we can get correct work function. "
+        locpot = LocPot(self.filename)
+        outcar = OutCar(path + "/OUTCAR", poscar=path + "/POSCAR")
+
+        ref_work_function = 4.4999001 - 1.3481
+        self.assertAlmostEqual(locpot.get_work_function(outcar),
+                               ref_work_function, places=6)
+        self.assertAlmostEqual(locpot.get_work_function(1.3481),
+                               ref_work_function, places=6)
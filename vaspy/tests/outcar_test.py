@@ -4,8 +4,13 @@ OutCar类单元测试.
 """
 
 import inspect
+import json
+import logging
 import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 import numpy as np
 import matplotlib
@@ -167,6 +172,234 @@ class OutCarTest(unittest.TestCase):
         self.assertEqual(ret_index, ref_index)
         self.assertListEqual(ret_max_force, ref_max_force)
 
+    def test_index(self):
+        " Test random access to ionic steps with byte offset index. "
+        filename = path + "/OUTCAR"
+        poscar = path + "/POSCAR"
+        outcar = OutCar(filename=filename, poscar=poscar)
+
+        self.assertEqual(outcar.nsteps, 4)
+        self.assertEqual(len(outcar.index["energy"]), 4)
+        with open(filename, "rb") as f:
+            f.seek(outcar.index["forces"][0])
+            self.assertTrue(f.readline().startswith(b" POSITION"))
+
+        # Steps counted from the first and the last.
+        self.assertEqual(outcar.forces(1), outcar.forces(-4))
+        self.assertEqual(outcar.forces(4), outcar.forces())
+        self.assertNotEqual(outcar.forces(1), outcar.forces(2))
+        self.assertEqual(outcar.forces(slice(-2, None)),
+                         [outcar.forces(3), outcar.forces(4)])
+        self.assertRaises(ValueError, outcar.forces, 5)
+        self.assertRaises(ValueError, outcar.forces, 0)
+
+        # Offsets must point to force block headers.
+        offset = outcar.index["forces"][0]
+        outcar.index["forces"][0] = outcar.index["energy"][0]
+        self.assertRaises(ValueError, outcar.forces, 1)
+        outcar.index["forces"][0] = offset
+
+        self.assertAlmostEqual(outcar.energies[0], -207.31741364)
+        self.assertEqual(len(outcar.energies), 4)
+
+    def test_force_blocks(self):
+        " Test parsing force blocks into arrays. "
+        filename = path + "/OUTCAR"
+        poscar = path + "/POSCAR"
+        outcar = OutCar(filename=filename, poscar=poscar)
+
+        self.assertEqual(outcar.natom, 36)
+        block = outcar.get_force_block(-1)
+        self.assertTupleEqual(block.shape, (36, 6))
+        coords, forces = outcar.forces(-1)
+        self.assertTrue(np.array_equal(block, np.hstack([coords, forces])))
+
+        self.assertTupleEqual(outcar.force_blocks.shape, (4, 36, 6))
+        self.assertTupleEqual(outcar.all_coordinates.shape, (4, 36, 3))
+        self.assertTrue(np.array_equal(outcar.all_forces[1], outcar.forces(2)[1]))
+        self.assertTrue(np.array_equal(outcar.all_coordinates[0], outcar.forces(1)[0]))
+
+    def test_cache_index(self):
+        " Test the byte offset index is saved and reused. "
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "OUTCAR")
+            shutil.copy(path + "/OUTCAR", filename)
+            outcar = OutCar(filename=filename, poscar=path + "/POSCAR",
+                            cache_index=True)
+            index = outcar.index
+            self.assertTrue(os.path.exists(outcar.get_index_name()))
+
+            cached = OutCar(filename=filename, poscar=path + "/POSCAR",
+                            cache_index=True)
+            self.assertEqual(index, cached.index)
+            self.assertEqual(outcar.forces(2), cached.forces(2))
+
+            # Malformed or older index files are rebuilt.
+            with open(outcar.get_index_name(), "r") as f:
+                content = f.read()
+            saved = json.loads(content)
+            del saved["version"], saved["end"]
+            for invalid in (content[:len(content)//2], json.dumps(saved)):
+                with open(outcar.get_index_name(), "w") as f:
+                    f.write(invalid)
+                rebuilt = OutCar(filename=filename, poscar=path + "/POSCAR",
+                                 cache_index=True)
+                self.assertEqual(index, rebuilt.index)
+                with open(outcar.get_index_name(), "r") as f:
+                    self.assertEqual(json.load(f), json.loads(content))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_force_analysis(self):
+        " Test max and RMS forces of all ionic steps. "
+        filename = path + "/OUTCAR"
+        poscar = path + "/POSCAR"
+        outcar = OutCar(filename=filename, poscar=poscar)
+
+        self.assertTupleEqual(outcar.tf_mask.shape, (36, 3))
+        self.assertListEqual(outcar.max_forces.tolist(), outcar.total_forces)
+        self.assertEqual(outcar.max_atoms[-1], outcar.last_max_atom)
+
+        for step in range(1, 5):
+            _, forces = outcar.forces(step)
+            masked = outcar._OutCar__mask_forces(forces, outcar.poscar.tf)
+            index, _ = outcar.fmax(forces)
+            self.assertEqual(outcar.max_atoms[step-1], index)
+            masked = np.array(masked)[outcar.tf_mask]
+            self.assertAlmostEqual(outcar.rms_forces[step-1],
+                                   np.sqrt(np.mean(masked**2)))
+
+    def test_refresh(self):
+        " Test incremental parsing of a growing OUTCAR. "
+        poscar = path + "/POSCAR"
+        ref = OutCar(filename=path + "/OUTCAR", poscar=poscar)
+        with open(ref.filename, "rb") as f:
+            content = f.read()
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "OUTCAR")
+            # Cut in the middle of the 3rd force block.
+            cut = ref.index["forces"][2] + 500
+            with open(filename, "wb") as f:
+                f.write(content[:cut])
+
+            outcar = OutCar(filename=filename, poscar=poscar)
+            self.assertEqual(outcar.nsteps, 2)
+            self.assertEqual(len(outcar.energies), 2)
+            self.assertEqual(len(outcar.max_forces), 2)
+            self.assertEqual(outcar.refresh(), 0)
+
+            # The block is completed and more steps are written.
+            with open(filename, "ab") as f:
+                f.write(content[cut: ref.index["energy"][3] + 10])
+            self.assertEqual(outcar.refresh(), 2)
+            self.assertFalse(outcar.restarted)
+            self.assertEqual(len(outcar.energies), 3)
+            with open(filename, "ab") as f:
+                f.write(content[ref.index["energy"][3] + 10:])
+            self.assertEqual(outcar.refresh(), 0)
+
+            self.assertTrue(np.array_equal(outcar.force_blocks, ref.force_blocks))
+            self.assertTrue(np.array_equal(outcar.max_forces, ref.max_forces))
+            self.assertTrue(np.array_equal(outcar.max_atoms, ref.max_atoms))
+            self.assertTrue(np.array_equal(outcar.rms_forces, ref.rms_forces))
+            self.assertTrue(np.array_equal(outcar.energies, ref.energies))
+            self.assertListEqual(outcar.total_forces, ref.total_forces)
+            self.assertEqual(outcar.efermi, ref.efermi)
+
+            # Arrays grow in place.
+            with open(filename, "wb") as f:
+                f.write(content[:ref.index["forces"][1]])
+            outcar = OutCar(filename=filename, poscar=poscar)
+            self.assertEqual(len(outcar.max_forces), 1)
+            self.assertEqual(len(outcar.energies), 1)
+            bases = []
+            for step in (2, 3):
+                with open(filename, "ab") as f:
+                    f.write(content[ref.index["forces"][step-1]: ref.index["forces"][step]])
+                self.assertEqual(outcar.refresh(), 1)
+                bases.append(outcar.force_blocks.base)
+            with open(filename, "ab") as f:
+                f.write(content[ref.index["forces"][3]:])
+            self.assertEqual(outcar.refresh(), 1)
+            self.assertIs(outcar.force_blocks.base, bases[-1])
+            self.assertIsNot(bases[0], bases[1])
+            self.assertTrue(np.array_equal(outcar.force_blocks, ref.force_blocks))
+            self.assertTrue(np.array_equal(outcar.max_forces, ref.max_forces))
+            self.assertTrue(np.array_equal(outcar.max_atoms, ref.max_atoms))
+            self.assertTrue(np.array_equal(outcar.rms_forces, ref.rms_forces))
+            self.assertTrue(np.array_equal(outcar.energies, ref.energies))
+
+            # The job is restarted.
+            with open(filename, "wb") as f:
+                f.write(content[:cut])
+            self.assertEqual(outcar.refresh(), 2)
+            self.assertTrue(outcar.restarted)
+            self.assertEqual(len(outcar.max_forces), 2)
+
+            # The job is restarted with a longer header.
+            with open(filename, "wb") as f:
+                f.write(b" restarted\n"*7 + content)
+            self.assertEqual(outcar.refresh(), 4)
+            self.assertTrue(outcar.restarted)
+            self.assertTrue(np.array_equal(outcar.forces(1), ref.forces(1)))
+            self.assertTrue(np.array_equal(outcar.max_forces, ref.max_forces))
+            self.assertTrue(np.array_equal(outcar.energies, ref.energies))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_lazy_poscar(self):
+        " Test OutCar without loading POSCAR. "
+        filename = path + "/OUTCAR"
+        outcar = OutCar(filename=filename, poscar=path + "/POSCAR_not_exist")
+
+        self.assertListEqual(outcar.atom_types, ["Pt"])
+        self.assertListEqual(outcar.atom_numbers, [36])
+        self.assertEqual(len(outcar.energies), 4)
+        self.assertFalse("poscar" in outcar.__dict__)
+        self.assertFalse(hasattr(outcar, "poscar"))
+
+        # All coordinates are movable.
+        self.assertTrue(outcar.tf_mask.all())
+        ref = OutCar(filename=filename, poscar=path + "/POSCAR")
+        norms = np.linalg.norm(ref.all_forces[-1], axis=1)
+        self.assertAlmostEqual(outcar.max_forces[-1], norms.max())
+
+        # POSCAR is loaded on first access.
+        self.assertFalse("poscar" in ref.__dict__)
+        self.assertNotEqual(outcar.max_forces[-1], ref.last_max_force)
+        self.assertTrue(isinstance(ref.__dict__["poscar"], PosCar))
+
+        # Inconsistent POSCAR.
+        outcar = OutCar(filename=filename, poscar=path + "/POSCAR_freq")
+        self.assertRaises(ValueError, getattr, outcar, "poscar")
+
+        outcar = OutCar(filename=path + "/OUTCAR_freq", poscar=None)
+        self.assertListEqual(outcar.atom_types, ["Pt", "O"])
+        self.assertListEqual(outcar.atom_numbers, [96, 2])
+
+        # Warn only if the given POSCAR is missing.
+        logger = logging.getLogger("vaspy.OutCar")
+        with mock.patch.object(logger, "warning") as warning:
+            outcar = OutCar(filename=filename, poscar=None)
+            self.assertTrue(outcar.tf_mask.all())
+            warning.assert_not_called()
+
+            outcar = OutCar(filename=filename, poscar=path + "/POSCAR_not_exist")
+            self.assertTrue(outcar.tf_mask.all())
+            self.assertFalse(hasattr(outcar, "poscar"))
+            self.assertEqual(warning.call_count, 1)
+
+    def test_efermi(self):
+        " Make sure we can get the Fermi level of last ionic step. "
+        filename = path + "/OUTCAR"
+        poscar = path + "/POSCAR"
+        outcar = OutCar(filename=filename, poscar=poscar)
+
+        self.assertEqual(outcar.efermi, 1.3481)
+
     def test_freq_iterator(self):
         " Make sure we can get correct frequency iterator. "
         filename = path + "/OUTCAR_freq"
@@ -13,4 +13,6 @@ from .xyzfile_test import XyzFileTest
 from .cif_test import CifFileTest
 from .ani_test import AniFileTest
 from .xdatcar_test import XdatCarTest
+from .chgcar_test import ChgCarTest
+from .locpot_test import LocPotTest
 